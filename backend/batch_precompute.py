@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+from collections import defaultdict
+from datetime import datetime
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+# Add parent dir to path if run from backend dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from services.detector import load_candidates, screen_candidate, summarize_candidate, classify_candidates, detect_subscriptions
+from services.bargain_hunter import plan_bargains, resolve_verdicts, assemble_bargains
+from services.bargain_memo import get_verdicts
+from services.transaction_loader import TX_PAGE_SIZE
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    print("Error: Supabase credentials missing!")
+    exit(1)
+
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+# Users read (and written back) per page
+BATCH_PAGE_SIZE = int(os.getenv("BATCH_PAGE_SIZE", "100"))
+# Unique keys per classification / analysis call
+BATCH_CLASSIFY_CHUNK = int(os.getenv("BATCH_CLASSIFY_CHUNK", "200"))
+CHECKPOINT_PATH = os.getenv("BATCH_CHECKPOINT", "batch_checkpoint.json")
+
+# 1. merchants:     classify the ambiguous merchant keys of each page of users, each unique key once
+# 2. subscriptions: re-run detection per user from the merchant cache only (no LLM)
+# 3. verdicts:      collect bargain memo keys of every user, analyze each unique key once
+# 4. bargains:      write every user's bargain_cache from the memo, one upsert per page
+PHASES = ["merchants", "subscriptions", "verdicts", "bargains"]
+
+def load_checkpoint(fresh: bool) -> dict:
+    """
+    Returns the saved progress, or a new run if there is none (or it finished).
+    """
+    if not fresh and os.path.exists(CHECKPOINT_PATH):
+        with open(CHECKPOINT_PATH) as f:
+            state = json.load(f)
+        if state.get("phase") in PHASES:
+            print(f"Resuming run from {state['started_at']}: phase {state['phase']}, after page {state['page']}")
+            return state
+    return {"started_at": datetime.now().isoformat(), "phase": PHASES[0], "page": 0}
+
+def save_checkpoint(state: dict):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+def iter_user_pages(after_page: int = 0):
+    """
+    Yields (page, [user_id]) over all auth users, starting after after_page.
+    """
+    page = after_page + 1
+    while True:
+        users = supabase.auth.admin.list_users(page=page, per_page=BATCH_PAGE_SIZE)
+        if not users:
+            return
+        yield page, [user.id for user in users]
+        if len(users) < BATCH_PAGE_SIZE:
+            return
+        page += 1
+
+def fetch_active_subscriptions(user_ids: list) -> list:
+    """
+    Returns every active subscription of the given users. Walks them with keyset
+    pagination on (user_id, id), so a page of users with more rows than
+    PostgREST's max-rows isn't silently cut off.
+    """
+    subscriptions = []
+    last = None
+    while True:
+        query = supabase.table("subscriptions") \
+            .select("*") \
+            .in_("user_id", user_ids) \
+            .eq("is_active", True)
+        if last is not None:
+            last_user, last_id = last
+            query = query.or_(f"user_id.gt.{last_user},and(user_id.eq.{last_user},id.gt.{last_id})")
+
+        rows = query.order("user_id").order("id").limit(TX_PAGE_SIZE).execute().data
+        # Stop on an empty page, not a short one: a short page may just be the server cap
+        if not rows:
+            return subscriptions
+        subscriptions.extend(rows)
+        last = (rows[-1]["user_id"], rows[-1]["id"])
+
+def classify_merchants(state: dict) -> bool:
+    # Only merchant keys outlive a page; a resumed run starts with none, and
+    # keys classified before the crash are merchant cache hits
+    seen = set()
+    for page, user_ids in iter_user_pages(state["page"]):
+        # merchant key -> compact candidate summary, for this page's users only
+        pending = {}
+        for user_id in user_ids:
+            try:
+                _, candidates = load_candidates(user_id, supabase)
+            except Exception as e:
+                print(f"Skipping merchants of {user_id}: {e}")
+                continue
+            for candidate in candidates:
+                if candidate["merchant"] in seen or screen_candidate(candidate) is not None:
+                    continue
+                # Classify from the user (on this page) with the most history for this merchant
+                current = pending.get(candidate["merchant"])
+                if current is None or len(candidate["txs"]) > len(current["txs"]):
+                    pending[candidate["merchant"]] = summarize_candidate(candidate)
+
+        summaries = list(pending.values())
+        resolved = 0
+        for start in range(0, len(summaries), BATCH_CLASSIFY_CHUNK):
+            resolved += len(classify_candidates(summaries[start:start + BATCH_CLASSIFY_CHUNK], supabase))
+        # Failed keys aren't retried this run; the next run picks them up
+        seen.update(pending)
+        print(f"Page {page}: classified {resolved}/{len(summaries)} new merchants ({len(seen)} so far)")
+
+        state["page"] = page
+        save_checkpoint(state)
+    return True
+
+def fan_out_subscriptions(state: dict) -> bool:
+    for page, user_ids in iter_user_pages(state["page"]):
+        for user_id in user_ids:
+            try:
+                # Cache only: merchants phase 1 couldn't classify wait for the next run
+                detect_subscriptions(user_id, supabase, allow_llm=False)
+            except Exception as e:
+                print(f"Detection failed for {user_id}: {e}")
+        state["page"] = page
+        save_checkpoint(state)
+    return True
+
+def analyze_verdicts(state: dict) -> bool:
+    # Same (service, price, candidate set) across users -> one memo key, one LLM call
+    unique = {}
+    for page, user_ids in iter_user_pages():
+        subscriptions = fetch_active_subscriptions(user_ids)
+        if not subscriptions:
+            continue
+        work = plan_bargains(subscriptions, supabase)
+        memo = get_verdicts([key for _, _, key in work], supabase)
+        for item in work:
+            if item[2] not in memo:
+                unique.setdefault(item[2], item)
+        print(f"Page {page}: {len(unique)} unique bargain keys to analyze so far")
+
+    work = list(unique.values())
+    for start in range(0, len(work), BATCH_CLASSIFY_CHUNK):
+        _, _, rate_limited = resolve_verdicts(work[start:start + BATCH_CLASSIFY_CHUNK], supabase)
+        print(f"Analyzed {min(start + BATCH_CLASSIFY_CHUNK, len(work))}/{len(work)} bargain keys")
+        if rate_limited:
+            # Everything analyzed so far is memoized; rerun later to pick up the rest
+            print("Rate limited; stopping here. Rerun to resume.")
+            return False
+    return True
+
+def fan_out_bargains(state: dict) -> bool:
+    for page, user_ids in iter_user_pages(state["page"]):
+        subscriptions = fetch_active_subscriptions(user_ids)
+        if subscriptions:
+            work = plan_bargains(subscriptions, supabase)
+            # Memo only: this phase never calls the LLM
+            verdicts = get_verdicts([key for _, _, key in work], supabase)
+
+            work_by_user = defaultdict(list)
+            for item in work:
+                work_by_user[item[0]["user_id"]].append(item)
+
+            now = datetime.now().isoformat()
+            rows = [
+                {
+                    "user_id": user_id,
+                    "data": assemble_bargains(user_work, verdicts),
+                    "last_checked_at": now,
+                    "is_rate_limited": any(key not in verdicts for _, _, key in user_work)
+                }
+                for user_id, user_work in work_by_user.items()
+            ]
+            if rows:
+                supabase.table("bargain_cache").upsert(rows, on_conflict="user_id").execute()
+            print(f"Page {page}: bargain cache written for {len(rows)} users")
+
+        state["page"] = page
+        save_checkpoint(state)
+    return True
+
+STEPS = {
+    "merchants": classify_merchants,
+    "subscriptions": fan_out_subscriptions,
+    "verdicts": analyze_verdicts,
+    "bargains": fan_out_bargains,
+}
+
+def main(fresh: bool = False) -> bool:
+    state = load_checkpoint(fresh)
+    save_checkpoint(state)
+
+    for phase in PHASES[PHASES.index(state["phase"]):]:
+        state["phase"] = phase
+        print(f"--- Phase: {phase} ---")
+        if not STEPS[phase](state):
+            save_checkpoint(state)
+            return False
+        # Next phase starts from the first page
+        state["page"] = 0
+        save_checkpoint(state)
+
+    state["phase"] = "done"
+    state["finished_at"] = datetime.now().isoformat()
+    save_checkpoint(state)
+    print("Batch precompute finished.")
+    return True
+
+if __name__ == "__main__":
+    # Usage: python batch_precompute.py [--fresh]
+    # Meant for a nightly cron; an interrupted run resumes from batch_checkpoint.json
+    ok = main(fresh="--fresh" in sys.argv[1:])
+    exit(0 if ok else 1)
@@ -48,3 +48,6 @@ create policy "Users can insert their own transactions." on public.transactions
 
 create policy "Service role can manage all transactions." on public.transactions
   for all using (true);
+
+-- Detection walks a user's transactions in (date, id) order, one page at a time
+create index if not exists transactions_user_date_id_idx on public.transactions (user_id, date, id);
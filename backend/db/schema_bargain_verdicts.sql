@@ -0,0 +1,16 @@
+-- Bargain Verdict Memo (shared across users)
+-- memo_key = normalized service | price bucket | hash of the candidate benchmark set.
+-- A changed benchmark set hashes to a new key, so old verdicts are simply never read again.
+create table if not exists public.bargain_verdicts (
+  memo_key text primary key,
+  verdict jsonb, -- null = no worthwhile alternative
+  created_at timestamp with time zone default now()
+);
+
+-- Enable RLS
+alter table public.bargain_verdicts enable row level security;
+
+-- Policies
+drop policy if exists "Service role can manage bargain verdicts." on public.bargain_verdicts;
+create policy "Service role can manage bargain verdicts." on public.bargain_verdicts
+  for all to service_role using (true) with check (true);
@@ -9,6 +9,25 @@ create table if not exists public.market_benchmarks (
   created_at timestamp with time zone default now()
 );
 
+-- One row per service tier; research and seeding upsert on this key
+do $$
+begin
+  if not exists (select 1 from pg_constraint where conname = 'market_benchmarks_service_name_tier_name_key') then
+    -- Concurrent research/seeding could insert the same tier twice; keep the newest row
+    delete from public.market_benchmarks b
+    using (
+      select id, row_number() over (
+        partition by service_name, tier_name
+        order by created_at desc nulls last, id desc
+      ) as rn
+      from public.market_benchmarks
+    ) d
+    where b.id = d.id and d.rn > 1;
+
+    alter table public.market_benchmarks add constraint market_benchmarks_service_name_tier_name_key unique (service_name, tier_name);
+  end if;
+end $$;
+
 -- Enable RLS
 alter table public.market_benchmarks enable row level security;
 
@@ -20,3 +39,18 @@ create policy "Benchmarks are viewable by everyone." on public.market_benchmarks
 -- Only service role can insert/update/delete (for now)
 create policy "Service role can manage benchmarks." on public.market_benchmarks
   for all using (true);
+
+-- Catalog versions: bumped whenever a category's benchmarks change so every
+-- API worker can tell its in-memory copy of the catalog is stale.
+-- The '*' row changes on every bump (covers full-catalog scans).
+create table if not exists public.benchmark_catalog_versions (
+  category text primary key,
+  version text not null,
+  updated_at timestamp with time zone default now()
+);
+
+alter table public.benchmark_catalog_versions enable row level security;
+
+drop policy if exists "Service role can manage catalog versions." on public.benchmark_catalog_versions;
+create policy "Service role can manage catalog versions." on public.benchmark_catalog_versions
+  for all to service_role using (true) with check (true);
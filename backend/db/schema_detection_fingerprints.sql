@@ -0,0 +1,21 @@
+-- Detection Fingerprints (Incremental Re-detection)
+-- Last verdict per (user, merchant group) plus a fingerprint of the transactions it was based on
+create table if not exists public.detection_fingerprints (
+  user_id uuid references auth.users(id) on delete cascade not null,
+  merchant_key text not null,
+  fingerprint text not null,
+  tx_count integer,
+  amount_sum decimal(12,2),
+  last_date date,
+  verdict jsonb,
+  updated_at timestamp with time zone default now(),
+  primary key (user_id, merchant_key)
+);
+
+-- Enable RLS
+alter table public.detection_fingerprints enable row level security;
+
+-- Policies
+drop policy if exists "Service role can manage all detection fingerprints." on public.detection_fingerprints;
+create policy "Service role can manage all detection fingerprints." on public.detection_fingerprints
+  for all to service_role using (true) with check (true);
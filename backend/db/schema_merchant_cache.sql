@@ -0,0 +1,19 @@
+-- Merchant Classification Cache (shared across users)
+-- One LLM verdict per normalized merchant key, reused by every user's detection run
+create table if not exists public.merchant_classifications (
+  merchant_key text primary key,
+  is_subscription boolean not null,
+  normalized_name text,
+  category text,
+  confidence real,
+  updated_at timestamp with time zone default now()
+);
+
+-- Enable RLS
+alter table public.merchant_classifications enable row level security;
+
+-- Policies
+-- Only the backend (service role) reads and writes classifications
+drop policy if exists "Service role can manage merchant classifications." on public.merchant_classifications;
+create policy "Service role can manage merchant classifications." on public.merchant_classifications
+  for all to service_role using (true) with check (true);
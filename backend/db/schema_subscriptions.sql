@@ -26,3 +26,24 @@ create policy "Users can update their own subscriptions." on public.subscription
 
 create policy "Service role can manage all subscriptions." on public.subscriptions
   for all using (true);
+
+-- One row per detected subscription name per user.
+-- Detection reconciles with a single upsert on this key.
+-- The old check-then-insert could race, so drop duplicates first
+-- (keeping the active, most recently detected row of each name).
+do $$
+begin
+  if not exists (select 1 from pg_constraint where conname = 'subscriptions_user_id_name_key') then
+    delete from public.subscriptions s
+    using (
+      select id, row_number() over (
+        partition by user_id, name
+        order by is_active desc nulls last, detected_at desc nulls last, created_at desc nulls last
+      ) as rn
+      from public.subscriptions
+    ) d
+    where s.id = d.id and d.rn > 1;
+
+    alter table public.subscriptions add constraint subscriptions_user_id_name_key unique (user_id, name);
+  end if;
+end $$;
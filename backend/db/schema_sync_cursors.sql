@@ -0,0 +1,18 @@
+-- Teller Sync Cursors (Incremental Sync)
+-- High-water mark per account so later syncs only page through new activity
+create table if not exists public.teller_sync_cursors (
+  user_id uuid references auth.users(id) on delete cascade not null,
+  account_id text not null,
+  last_transaction_id text,
+  last_transaction_date date,
+  updated_at timestamp with time zone default now(),
+  primary key (user_id, account_id)
+);
+
+-- Enable RLS
+alter table public.teller_sync_cursors enable row level security;
+
+-- Policies
+drop policy if exists "Service role can manage all sync cursors." on public.teller_sync_cursors;
+create policy "Service role can manage all sync cursors." on public.teller_sync_cursors
+  for all to service_role using (true) with check (true);
@@ -0,0 +1,23 @@
+-- Teller Accounts (Webhook Sync)
+-- Maps a Teller account to its user and enrollment access token, so webhook
+-- events can trigger an incremental fetch without the frontend calling /sync
+create table if not exists public.teller_accounts (
+  account_id text primary key,
+  user_id uuid references auth.users(id) on delete cascade not null,
+  enrollment_id text not null,
+  access_token text not null,
+  status text default 'connected', -- 'connected' | 'disconnected'
+  updated_at timestamp with time zone default now()
+);
+
+create index if not exists teller_accounts_enrollment_idx on public.teller_accounts (enrollment_id);
+
+-- Enable RLS
+alter table public.teller_accounts enable row level security;
+
+-- Policies
+-- Access tokens never leave the backend: only service_role has a policy,
+-- so anon/authenticated PostgREST clients can neither read nor write rows
+drop policy if exists "Service role can manage teller accounts." on public.teller_accounts;
+create policy "Service role can manage teller accounts." on public.teller_accounts
+  for all to service_role using (true) with check (true);
@@ -1,20 +1,30 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
+import hmac
+import time
 
 load_dotenv()
 
 from auth import verify_token
-from routers import teller, subscriptions, bargains
+from routers import teller, subscriptions, bargains, webhooks
 from supabase import create_client, Client
+from services import metrics
+from services.profiling import should_profile, RequestProfile, ProfiledRoute
 
 # Initialize Supabase client for health checks
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase: Client = metrics.instrument_supabase(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
+
+# Shared secret for scraping /api/metrics (sent as "Authorization: Bearer <token>").
+# Without it the endpoint is disabled: nginx proxies every /api path publicly.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 app = FastAPI(title="SubscriptCheck API")
+# Sync endpoints register their thread with the request profiler (if one is running)
+app.router.route_class = ProfiledRoute
 
 # Configure CORS
 origins = [
@@ -37,9 +47,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/detect/jobs/{job_id}), not raw path, to keep cardinality low
+        metrics.observe_request(request.method, metrics.route_template(request.scope), status, time.perf_counter() - started)
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Opt-in per request (X-Profile header with PROFILE_TOKEN); free otherwise
+    if not should_profile(request.headers):
+        return await call_next(request)
+
+    profile = RequestProfile(request.method, request.url.path)
+    profile.start()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        profile_id = profile.stop(status)
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
 app.include_router(teller.router, prefix="/api/teller")
 app.include_router(subscriptions.router, prefix="/api/subscriptions")
 app.include_router(bargains.router, prefix="/api/bargains")
+app.include_router(webhooks.router, prefix="/api/webhooks")
 
 @app.get("/api")
 def read_root():
@@ -56,6 +97,15 @@ def health_check():
         # but report the DB status
         return {"status": "degraded", "supabase": "disconnected", "error": str(e)}
 
+@app.get("/api/metrics")
+def get_metrics(request: Request):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/me")
 def get_current_user(user_payload: dict = Depends(verify_token)):
     return {
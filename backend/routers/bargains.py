@@ -5,8 +5,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from services.bargain_hunter import find_bargains
 from supabase import create_client, Client
+from services.profiling import ProfiledRoute
+from services.metrics import instrument_supabase, observe_cache
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -14,49 +16,125 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
     raise ValueError("Missing Supabase credentials")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase: Client = instrument_supabase(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
 
 from datetime import datetime, timedelta
+from services.ttl_cache import TTLCache
+from services.job_runner import bargain_refresh_jobs
+
+# Bargains older than this are stale and get re-analyzed in the background on the next read
+CACHE_MAX_AGE = timedelta(hours=24)
+
+# In-process L1 in front of the bargain_cache table. Short TTL so a refresh
+# done by another worker process shows up here within a few minutes.
+BARGAIN_L1_SIZE = int(os.getenv("BARGAIN_L1_SIZE", "10000"))
+BARGAIN_L1_TTL_SECONDS = int(os.getenv("BARGAIN_L1_TTL_SECONDS", "300"))
+l1_cache = TTLCache(maxsize=BARGAIN_L1_SIZE, ttl=BARGAIN_L1_TTL_SECONDS)
+
+# A refresh that left the entry stale (rate limited or failed) isn't retried
+# for this long, however often the entry is read
+BARGAIN_REFRESH_BACKOFF = timedelta(seconds=int(os.getenv("BARGAIN_REFRESH_BACKOFF_SECONDS", "900")))
+
+def _get_cached(user_id: str):
+    """
+    Returns {"data", "last_checked_at", "is_rate_limited"} from L1, falling back
+    to bargain_cache, or None.
+    """
+    entry = l1_cache.get(user_id)
+    if entry is not None:
+        observe_cache("bargain_l1", "hit")
+        return entry
+    observe_cache("bargain_l1", "miss")
+
+    cache_response = supabase.table("bargain_cache") \
+        .select("data, last_checked_at, is_rate_limited") \
+        .eq("user_id", user_id) \
+        .execute()
+    if not cache_response.data:
+        return None
+
+    cached_row = cache_response.data[0]
+    entry = {
+        "data": cached_row["data"],
+        "last_checked_at": datetime.fromisoformat(cached_row["last_checked_at"].replace('Z', '+00:00')),
+        "is_rate_limited": bool(cached_row.get("is_rate_limited"))
+    }
+    l1_cache.set(user_id, entry)
+    return entry
+
+def _forget(user_id: str):
+    # find_bargains just wrote bargain_cache (including whether it was rate
+    # limited); the next read reloads that row into L1
+    l1_cache.delete(user_id)
+
+def _refresh_bargains(user_id: str, progress):
+    progress("analyzing")
+    opportunities = find_bargains(user_id, supabase)
+    _forget(user_id)
+    return {"count": len(opportunities)}
 
 @router.get("/")
 def get_bargain_opportunities(refresh: bool = False, user_payload: dict = Depends(verify_token)):
     user_id = user_payload.get("sub")
     
     try:
-        # Check Cache first
-        cache_response = supabase.table("bargain_cache") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .execute()
+        # Check Cache first (memory, then bargain_cache)
+        cached = _get_cached(user_id)
             
         cached_data = None
         is_fresh = False
         
-        if cache_response.data:
-            cached_row = cache_response.data[0]
-            last_checked = datetime.fromisoformat(cached_row["last_checked_at"].replace('Z', '+00:00'))
+        if cached is not None:
+            cached_data = cached["data"]
+            last_checked = cached["last_checked_at"]
             
-            # Check if cache is fresh (less than 24 hours old)
-            if datetime.now(last_checked.tzinfo) - last_checked < timedelta(hours=24):
+            # Check if cache is fresh (less than 24 hours old, and complete:
+            # a rate-limited run left some subscriptions unanalyzed)
+            if datetime.now(last_checked.tzinfo) - last_checked < CACHE_MAX_AGE and not cached["is_rate_limited"]:
                 is_fresh = True
-                cached_data = cached_row["data"]
+                observe_cache("bargain_cache", "hit")
+            else:
+                observe_cache("bargain_cache", "stale")
+        else:
+            observe_cache("bargain_cache", "miss")
                 
         # DECISION LOGIC:
-        # 1. If NOT refreshing -> Return cache if exists (regardless of age), else fetch.
-        # 2. If REFRESHING -> Only fetch if cache is OLD (>24h). If fresh, refuse to update (save cost).
-        
-        if not refresh:
-            if cached_data is not None:
-                return {"count": len(cached_data), "data": cached_data, "source": "cache"}
-        
-        # If refreshing, but data is already fresh (<24h), return it anyway to save API costs
-        if refresh and is_fresh:
-            print(f"Skipping refresh for {user_id}: Data is fresh (<24h old).")
-            return {"count": len(cached_data), "data": cached_data, "source": "cache_fresh_hit"}
+        # 1. Fresh cache (<24h, complete) -> return it. refresh=true doesn't re-analyze (save cost).
+        # 2. Stale cache (>24h or rate limited) -> return it right away and re-analyze in
+        #    the background, one job per user, whether or not refresh was requested
+        #    (at most once per BARGAIN_REFRESH_BACKOFF).
+        # 3. No cache -> analyze now.
+
+        if is_fresh:
+            if refresh:
+                print(f"Skipping refresh for {user_id}: Data is fresh (<24h old).")
+            return {
+                "count": len(cached_data),
+                "data": cached_data,
+                "source": "cache_fresh_hit" if refresh else "cache",
+                "refreshing": bargain_refresh_jobs.is_active(user_id)
+            }
+
+        # Stale-while-revalidate: serve what we have, refresh in the background
+        # unless the last refresh finished (and still left it stale) recently
+        if cached_data is not None:
+            last = bargain_refresh_jobs.last_finished(user_id)
+            if last and datetime.now() - datetime.fromisoformat(last["finished_at"]) < BARGAIN_REFRESH_BACKOFF:
+                print(f"Serving stale bargains for {user_id}; last refresh {last['status']} at {last['finished_at']}, backing off")
+            else:
+                job = bargain_refresh_jobs.submit(user_id, user_id, _refresh_bargains, user_id)
+                print(f"Serving stale bargains for {user_id}, refresh job {job['job_id']} ({job['status']})")
+            return {
+                "count": len(cached_data),
+                "data": cached_data,
+                "source": "cache_stale",
+                "refreshing": bargain_refresh_jobs.is_active(user_id)
+            }
 
-        # Perform Analysis (Expensive)
+        # Nothing cached at all: Perform Analysis (Expensive)
         opportunities = find_bargains(user_id, supabase)
-        return {"count": len(opportunities), "data": opportunities, "source": "fresh_analysis"}
+        _forget(user_id)
+        return {"count": len(opportunities), "data": opportunities, "source": "fresh_analysis", "refreshing": False}
         
     except Exception as e:
         print(f"Error in get_bargain_opportunities: {e}")
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from auth import verify_token
 # Fix import path for services
 import sys
 import os
+import json
+import time
+import asyncio
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from services.detector import detect_subscriptions
+from services.job_runner import detection_jobs
 from supabase import create_client, Client
+from services.profiling import ProfiledRoute
+from services.metrics import instrument_supabase
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -15,20 +22,113 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
     raise ValueError("Missing Supabase credentials")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase: Client = instrument_supabase(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
+
+# Idle seconds before the detection stream sends a ping line (keeps proxies from timing out)
+STREAM_KEEPALIVE_SECONDS = int(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+# How often async endpoints check a detection job for new events or completion
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.25"))
+
+def _run_detection(user_id: str, progress):
+    """
+    Detection as a detection_jobs job; verdicts are published to the job's
+    event log as they are decided, for /detect/stream to follow.
+    """
+    def on_verdict(merchant, verdict, source):
+        progress.publish({
+            "event": "verdict",
+            "merchant": merchant,
+            "source": source,
+            "is_subscription": bool(verdict.get("is_subscription")),
+            "name": verdict.get("normalized_name"),
+            "category": verdict.get("category"),
+            "frequency": verdict.get("frequency")
+        })
+
+    return detect_subscriptions(user_id, supabase, progress, on_verdict)
 
 @router.post("/detect")
-def trigger_detection(user_payload: dict = Depends(verify_token)):
+async def trigger_detection(background: bool = False, user_payload: dict = Depends(verify_token)):
     user_id = user_payload.get("sub")
-    
-    try:
-        # Call the detection service
-        # We need to pass the supabase client or initialize it inside
-        # The service expects (user_id, supabase_client)
-        result = detect_subscriptions(user_id, supabase)
-        return {"status": "success", "data": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+    # Every mode runs the user's one detection job: a request while a run is
+    # active joins it instead of starting a second detection
+    job = detection_jobs.submit(user_id, user_id, _run_detection, user_id)
+
+    if background:
+        # Job mode: return immediately, poll /detect/jobs/{job_id} for the result.
+        return {"status": "accepted", "job": job}
+
+    # Wait for the job without holding a threadpool worker
+    while job and job["status"] in ("queued", "running"):
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        job = detection_jobs.get(job["job_id"])
+
+    if not job or job["status"] != "completed":
+        raise HTTPException(status_code=500, detail=job["error"] if job else "Job expired")
+    return {"status": "success", "data": job["result"]}
+
+@router.post("/detect/stream")
+async def stream_detection(user_payload: dict = Depends(verify_token)):
+    """
+    Runs detection as a detection_jobs job (joining the user's active run, if any)
+    and streams its NDJSON events: {"event": "candidates", "count"} once groups are
+    built, one {"event": "verdict", ...} per merchant group as it is decided,
+    {"event": "progress", ...} per stage, then {"event": "summary", "data"}
+    (or {"event": "error", "detail"}).
+    Async on purpose: following a long run must not hold a threadpool worker.
+    """
+    user_id = user_payload.get("sub")
+    # Detection keeps running (and saves) even if the client goes away
+    job_id = detection_jobs.submit(user_id, user_id, _run_detection, user_id)["job_id"]
+
+    async def lines():
+        index = 0
+        last_sent = time.monotonic()
+        while True:
+            update = detection_jobs.events_since(job_id, index)
+            if update is None:
+                yield json.dumps({"event": "error", "detail": "Job expired"}) + "\n"
+                return
+            events, finished = update
+            index += len(events)
+
+            for event in events:
+                if event["event"] == "progress" and event["stage"] == "grouped":
+                    event = {"event": "candidates", "count": event["total"]}
+                yield json.dumps(event) + "\n"
+            if events:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= STREAM_KEEPALIVE_SECONDS:
+                yield json.dumps({"event": "ping"}) + "\n"
+                last_sent = time.monotonic()
+
+            if finished:
+                break
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+        job = detection_jobs.get(job_id)
+        if job and job["status"] == "completed":
+            yield json.dumps({"event": "summary", "data": job["result"]}) + "\n"
+        else:
+            print(f"Streaming detection failed for {user_id}: {job and job['error']}")
+            yield json.dumps({"event": "error", "detail": job["error"] if job else "Job expired"}) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        # Stop nginx-style proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/detect/jobs/{job_id}")
+def get_detection_job(job_id: str, user_payload: dict = Depends(verify_token)):
+    user_id = user_payload.get("sub")
+
+    job = detection_jobs.get(job_id, owner=user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @router.get("/")
 def get_subscriptions(user_payload: dict = Depends(verify_token)):
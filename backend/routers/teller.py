@@ -1,12 +1,18 @@
 import os
+import time
 import datetime
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from auth import verify_token
 from teller_service import client as teller_client
+from services.transaction_ingest import map_teller_transaction, bulk_upsert_transactions
+from services.sync_cursors import load_cursors, advance_cursors
+from services.webhook_sync import register_accounts
 from supabase import create_client, Client
+from services.profiling import ProfiledRoute
+from services.metrics import instrument_supabase, observe_sync
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -14,7 +20,7 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
     raise ValueError("Missing Supabase credentials")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+supabase: Client = instrument_supabase(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
 
 @router.post("/sync")
 def sync_transactions(payload: dict, user_payload: dict = Depends(verify_token)):
@@ -23,52 +29,37 @@ def sync_transactions(payload: dict, user_payload: dict = Depends(verify_token))
         raise HTTPException(status_code=400, detail="Missing access_token")
     
     user_id = user_payload.get("sub")
+    # Backfill ignores the stored cursors and pages through the full history
+    backfill = bool(payload.get("backfill", False))
+
+    started = time.perf_counter()
 
     try:
         # 1. List accounts to get account_ids
         accounts = teller_client.list_accounts(access_token)
+        # Lets Teller webhooks trigger incremental fetches for these accounts later
+        register_accounts(user_id, access_token, accounts, supabase)
         
-        total_synced = 0
-        
-        for account in accounts:
-            account_id = account['id']
-            # account_name = account['name']
-            
-            # 2. Fetch transactions for each account
-            # Teller provides 90 days of history by default for free tier
-            transactions = teller_client.get_transactions(access_token, account_id)
-            
-            for t in transactions:
-                # Map Teller transaction to our DB schema
-                # Teller trans keys: id, account_id, amount, date, description, type, status, links
-                
-                amount = float(t['amount'])
-                # Teller amounts are strings. Positive for credit, negative for debit
-                # We might want to standardize. Let's keep as is for now or flip based on schema preference.
-                # Usually expense = positive in personal finance apps, but banking APIs vary.
-                # Plaid: + is money out. Teller: - is money out.
-                # Let's flip Teller to match Plaid convention if desired, or just store raw.
-                # For now, storing raw magnitude might be safer, but let's just convert to float.
-                
-                data = {
-                    "user_id": user_id,
-                    "teller_transaction_id": t['id'],
-                    "account_id": t['account_id'],
-                    "name": t['description'], 
-                    "merchant_name": t.get('details', {}).get('counterparty', {}).get('name'), # basic attempt to parse
-                    "amount": amount,
-                    "date": t['date'],
-                    "category": t.get('details', {}).get('category'), # Teller might not provide this in basic
-                    "raw_json": t
-                }
-                
-                try:
-                    supabase.table("transactions").upsert(data, on_conflict="teller_transaction_id").execute()
-                    total_synced += 1
-                except Exception as e:
-                    print(f"Error saving transaction {t['id']}: {e}")
+        # 2. Fetch transactions for all accounts concurrently
+        # Only activity newer than each account's cursor is paged in, unless backfilling
+        account_ids = [account['id'] for account in accounts]
+        cursors = {} if backfill else load_cursors(user_id, supabase)
+        transactions_by_account = teller_client.get_transactions_for_accounts(access_token, account_ids, cursors=cursors)
+
+        rows = []
+        for transactions in transactions_by_account.values():
+            rows.extend(map_teller_transaction(t, user_id) for t in transactions)
+
+        # 3. Save in a handful of chunked upserts instead of one request per row
+        total_synced, failures = bulk_upsert_transactions(rows, supabase)
+
+        # 4. Move the high-water marks forward for accounts that saved cleanly
+        failed_ids = {f["id"] for f in failures}
+        advance_cursors(user_id, transactions_by_account, failed_ids, supabase)
+
+        observe_sync(total_synced, time.perf_counter() - started)
 
-        return {"message": "Sync complete", "total_synced": total_synced}
+        return {"message": "Sync complete", "total_synced": total_synced, "failed": failures, "mode": "backfill" if backfill else "incremental"}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,58 @@
+import os
+import json
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from teller_service import client as teller_client
+from services.webhook_sync import TELLER_WEBHOOK_SECRETS, verify_signature, disconnect_enrollment, AccountSyncQueue
+from supabase import create_client, Client
+from services.profiling import ProfiledRoute
+from services.metrics import instrument_supabase
+
+router = APIRouter(route_class=ProfiledRoute)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    raise ValueError("Missing Supabase credentials")
+
+supabase: Client = instrument_supabase(create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
+
+account_sync = AccountSyncQueue(supabase, teller_client)
+
+@router.post("/teller")
+async def receive_teller_webhook(request: Request):
+    """
+    Teller webhook receiver. Verifies the Teller-Signature header, then acks
+    right away; fetching happens on the debounced background queue.
+    """
+    if not TELLER_WEBHOOK_SECRETS:
+        raise HTTPException(status_code=503, detail="Webhooks are not configured")
+
+    body = await request.body()
+    if not verify_signature(body, request.headers.get("teller-signature")):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    event_type = event.get("type")
+    payload = event.get("payload") or {}
+
+    if event_type == "transactions.processed":
+        account_ids = sorted({t["account_id"] for t in payload.get("transactions", []) if t.get("account_id")})
+        account_sync.schedule(account_ids)
+        print(f"Webhook {event.get('id')}: queued sync for {len(account_ids)} accounts")
+        return {"status": "queued", "accounts": len(account_ids)}
+
+    if event_type == "enrollment.disconnected":
+        enrollment_id = payload.get("enrollment_id")
+        # Blocking Supabase call; keep it off the event loop
+        count = await run_in_threadpool(disconnect_enrollment, enrollment_id, supabase) if enrollment_id else 0
+        print(f"Webhook {event.get('id')}: enrollment {enrollment_id} disconnected ({count} accounts)")
+        return {"status": "disconnected", "accounts": count}
+
+    # webhook.test and event types we don't act on
+    return {"status": "ignored", "type": event_type}
@@ -5,6 +5,7 @@ from supabase import create_client, Client
 
 # Add parent dir to path if run from backend dir
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from services.benchmark_catalog import upsert_benchmarks
 
 load_dotenv()
 
@@ -74,25 +75,11 @@ def seed_benchmarks():
         {"service_name": "Dropbox", "tier_name": "Basic", "monthly_price": 0.00, "category": "Technology", "features": {"storage": "2GB Free"}},
     ]
 
-    count = 0
-    for benchmark in benchmarks:
-        try:
-            # Check duplicates roughly by service + tier
-            existing = supabase.table("market_benchmarks") \
-                .select("id") \
-                .eq("service_name", benchmark["service_name"]) \
-                .eq("tier_name", benchmark["tier_name"]) \
-                .execute()
-                
-            if not existing.data:
-                supabase.table("market_benchmarks").insert(benchmark).execute()
-                count += 1
-            else:
-                print(f"Skipping {benchmark['service_name']} {benchmark['tier_name']} (exists)")
-        except Exception as e:
-            print(f"Error seeding {benchmark['service_name']}: {e}")
-            
-    print(f"Successfully seeded {count} new benchmarks.")
+    try:
+        count = upsert_benchmarks(benchmarks, supabase)
+        print(f"Successfully seeded {count} benchmarks.")
+    except Exception as e:
+        print(f"Error seeding benchmarks: {e}")
 
 if __name__ == "__main__":
     seed_benchmarks()
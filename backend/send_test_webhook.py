@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import uuid
+import requests
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+# Add parent dir to path if run from backend dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from services.webhook_sync import sign_payload
+
+load_dotenv()
+
+# Local stand-in for Teller: sends signed webhook events to a running backend
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "http://localhost:8000/api/webhooks/teller")
+SECRETS = [s.strip() for s in os.getenv("TELLER_WEBHOOK_SECRETS", "").split(",") if s.strip()]
+
+def build_event(kind: str, target: str = None) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    if kind == "transactions":
+        # Teller sends the processed transactions; the receiver only needs their account ids
+        payload = {"transactions": [{"id": f"txn_{uuid.uuid4().hex[:12]}", "account_id": target, "status": "posted"}]}
+        event_type = "transactions.processed"
+    elif kind == "disconnect":
+        payload = {"enrollment_id": target, "reason": "disconnected"}
+        event_type = "enrollment.disconnected"
+    else:
+        payload = {}
+        event_type = "webhook.test"
+    return {"id": f"wh_{uuid.uuid4().hex[:12]}", "type": event_type, "timestamp": now, "payload": payload}
+
+def send(event: dict) -> requests.Response:
+    body = json.dumps(event).encode()
+    response = requests.post(
+        WEBHOOK_URL,
+        data=body,
+        headers={"Content-Type": "application/json", "Teller-Signature": sign_payload(body, SECRETS[0])}
+    )
+    print(f"{event['type']} -> {response.status_code} {response.text}")
+    return response
+
+if __name__ == "__main__":
+    if not SECRETS:
+        print("Error: set TELLER_WEBHOOK_SECRETS (same value as the backend).")
+        exit(1)
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("transactions", "disconnect", "test"):
+        print("Usage: python send_test_webhook.py transactions <ACCOUNT_ID> [BURST]")
+        print("       python send_test_webhook.py disconnect <ENROLLMENT_ID>")
+        print("       python send_test_webhook.py test")
+        exit(1)
+
+    kind = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    # A burst of events for one account should still produce a single fetch
+    burst = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    for _ in range(burst):
+        send(build_event(kind, target))
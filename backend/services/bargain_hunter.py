@@ -1,17 +1,29 @@
 import os
+import re
 import json
+import contextvars
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-from groq import Groq
 from supabase import Client
 
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+# Cheaper benchmarks sent to the LLM per subscription after local ranking
+BARGAIN_TOP_K = int(os.getenv("BARGAIN_TOP_K", "5"))
 
-MODEL = "llama-3.3-70b-versatile"
+# Subscriptions analyzed at the same time (Groq quota is enforced by the LLM gateway)
+BARGAIN_CONCURRENCY = int(os.getenv("BARGAIN_CONCURRENCY", "4"))
 
-from services.knowledge_manager import ensure_category_knowledge
+# Marks a subscription whose analysis didn't complete (distinct from "no bargain" = None)
+_SKIPPED = object()
+
+from services.knowledge_manager import ensure_categories_knowledge
+from services.benchmark_catalog import catalog
+from services.bargain_memo import memo_key, get_verdicts, store_verdicts
+from services.llm_gateway import chat_json, LLMRateLimitError
+from services.profiling import traced
 
 def find_bargains(user_id: str, supabase: Client) -> List[Dict]:
     """
@@ -34,14 +46,50 @@ def find_bargains(user_id: str, supabase: Client) -> List[Dict]:
     if not subscriptions:
         return []
         
+    work = plan_bargains(subscriptions, supabase)
+    verdicts, incomplete, rate_limited = resolve_verdicts(work, supabase)
+    bargains = assemble_bargains(work, verdicts)
+    
+    if incomplete:
+        reason = "Rate limited" if rate_limited else "Some analyses failed"
+        print(f"{reason} while hunting bargains for {user_id}; returning {len(bargains)} partial results.")
+    
+    # 3. Update Cache
+    try:
+        supabase.table("bargain_cache").upsert({
+            "user_id": user_id,
+            "data": bargains,
+            "last_checked_at": datetime.now().isoformat(),
+            # Any unanalyzed subscription marks the entry stale, so it is retried
+            "is_rate_limited": incomplete
+        }).execute()
+    except Exception as e:
+        print(f"Failed to update cache: {e}")
+            
+    return bargains
+
+def plan_bargains(subscriptions: List[Dict], supabase: Client) -> List[tuple]:
+    """
+    Matches subscriptions (of one or many users) to candidate benchmarks,
+    researching stale categories first. Returns [(sub, benchmarks, memo_key)]
+    for the subscriptions that have any benchmarks.
+    """
     # --- KNOWLEDGE FRESHNESS CHECK ---
     # Before analyzing, ensure we have data for these categories
     categories = set(sub.get("category") for sub in subscriptions if sub.get("category"))
-    for cat in categories:
-        ensure_category_knowledge(cat, supabase)
+    # Warm the shared catalog for all categories in one query
+    catalog.get_benchmarks(categories, supabase)
+    # Stale categories are researched in parallel (one in-flight call per category)
+    ensure_categories_knowledge(categories, supabase)
     # ---------------------------------
+    
+    # Load every benchmark we may need up front and match in memory
+    index = _load_benchmark_index(categories, supabase)
+    if any(not index["by_category"].get(sub.get("category") or "") for sub in subscriptions):
+        # Some subscriptions need the name fallback, which can hit any category
+        index = _load_benchmark_index(None, supabase)
         
-    bargains = []
+    work = []
     
     for sub in subscriptions:
         sub_name = sub["name"]
@@ -50,47 +98,169 @@ def find_bargains(user_id: str, supabase: Client) -> List[Dict]:
         # SEARCH STRATEGY: 
         # 1. Search by Category (Broader "Knowledge Base" approach)
         # This allows finding "DaVinci Resolve" (Software) when analyzing "Adobe" (Software)
-        bench_response = supabase.table("market_benchmarks") \
-            .select("*") \
-            .eq("category", category) \
-            .execute()
-            
-        benchmarks = bench_response.data
+        benchmarks = index["by_category"].get(category or "", [])
         
         if not benchmarks:
             # Fallback: Try fuzzy name match if category is missing or empty
-            bench_response = supabase.table("market_benchmarks") \
-                .select("*") \
-                .ilike("service_name", f"%{sub_name}%") \
-                .execute()
-            benchmarks = bench_response.data
+            needle = _normalize_service_name(sub_name)
+            benchmarks = [
+                b for name, rows in index["by_name"].items()
+                if needle and needle in name
+                for b in rows
+            ]
             
         if not benchmarks:
             continue
-            
-        # Analyze with LLM
-        opportunity = _analyze_bargain_opportunity(sub, benchmarks)
         
-        if opportunity:
-            opportunity["subscription_id"] = sub["id"]
-            bargains.append(opportunity)
+        work.append((sub, benchmarks, memo_key(sub, benchmarks)))
     
-    # 3. Update Cache
-    try:
-        supabase.table("bargain_cache").upsert({
-            "user_id": user_id,
-            "data": bargains,
-            "last_checked_at": datetime.now().isoformat(),
-            "is_rate_limited": False # Assuming we made it here without hard failing
-        }).execute()
-    except Exception as e:
-        print(f"Failed to update cache: {e}")
-            
-    return bargains
+    return work
+
+def resolve_verdicts(work: List[tuple], supabase: Client) -> tuple:
+    """
+    Returns ({memo_key: verdict}, incomplete, rate_limited) for planned work:
+    memoized verdicts first, then one LLM call per distinct missing key (stored
+    back). incomplete is True when any key is left without a verdict.
+    """
+    # Verdicts are shared across users: same service, price and candidate set -> same answer
+    memo = get_verdicts([key for _, _, key in work], supabase)
+    
+    # One LLM call per distinct key, several in flight at once (the limiter keeps us under quota)
+    pending = {}
+    for sub, benchmarks, key in work:
+        if key not in memo and key not in pending:
+            pending[key] = (sub, benchmarks)
+    
+    fresh_verdicts, incomplete, rate_limited = _analyze_concurrently(pending)
+    store_verdicts(fresh_verdicts, supabase)
+    return {**memo, **fresh_verdicts}, incomplete, rate_limited
+
+def assemble_bargains(work: List[tuple], verdicts: Dict[str, Dict]) -> List[Dict]:
+    """
+    Turns resolved verdicts back into per-subscription bargains.
+    """
+    return [
+        {**verdicts[key], "subscription_id": sub["id"]}
+        for sub, _, key in work
+        if verdicts.get(key)
+    ]
+
+def _analyze_concurrently(pending: Dict[str, tuple]) -> tuple:
+    """
+    Runs _analyze_bargain_opportunity for {memo_key: (sub, benchmarks)} on a
+    bounded pool. After the first rate-limit failure no new calls are started.
+    Returns ({memo_key: verdict}, incomplete, rate_limited); incomplete is True
+    when any key was skipped (rate limit, timeout, unparseable answer...).
+    """
+    if not pending:
+        return {}, False, False
+    
+    stop = threading.Event()
+    
+    def analyze(sub, benchmarks):
+        if stop.is_set():
+            return _SKIPPED
+        try:
+            return _analyze_bargain_opportunity(sub, benchmarks, strict=True)
+        except LLMRateLimitError:
+            stop.set()
+            return _SKIPPED
+        except Exception:
+            # Failed calls are skipped, and never memoized as "no bargain"
+            return _SKIPPED
+    
+    workers = max(1, min(BARGAIN_CONCURRENCY, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {key: executor.submit(contextvars.copy_context().run, traced(analyze), sub, benchmarks) for key, (sub, benchmarks) in pending.items()}
+        results = {key: future.result() for key, future in futures.items()}
+    
+    verdicts = {key: verdict for key, verdict in results.items() if verdict is not _SKIPPED}
+    return verdicts, len(verdicts) < len(pending), stop.is_set()
 
-def _analyze_bargain_opportunity(sub: Dict, benchmarks: List[Dict]) -> Optional[Dict]:
+def _load_benchmark_index(categories: Optional[set], supabase: Client) -> Dict:
+    """
+    Reads benchmarks for the given categories (or the whole catalog when None)
+    from the shared catalog cache and indexes them by category and by
+    normalized service name.
+    """
+    if categories is not None:
+        rows = [b for bs in catalog.get_benchmarks(categories, supabase).values() for b in bs]
+    else:
+        rows = catalog.get_all(supabase)
+
+    by_category = defaultdict(list)
+    by_name = defaultdict(list)
+    for b in rows:
+        by_category[b.get("category") or ""].append(b)
+        by_name[_normalize_service_name(b["service_name"])].append(b)
+
+    return {"by_category": by_category, "by_name": by_name}
+
+def _rank_candidates(sub: Dict, options: List[Dict]) -> List[tuple]:
+    """
+    Scores cheaper benchmarks by savings, same-service tier, replacement_for
+    matches and name similarity. Returns [(score, benchmark)] best first.
+    """
+    price = float(sub["amount"])
+    sub_names = " ".join(_normalize_service_name(n) for n in (sub["name"], sub.get("merchant_name")) if n)
+    sub_tokens = set(sub_names.split())
+
+    ranked = []
+    for b in options:
+        service = _normalize_service_name(b["service_name"])
+        features = b.get("features") if isinstance(b.get("features"), dict) else {}
+        replacement_for = set(_normalize_service_name(str(features.get("replacement_for", ""))).split())
+
+        savings = (price - float(b["monthly_price"])) / price if price > 0 else 0.0
+        same_service = 1.0 if _is_same_service(service, sub_names) else 0.0
+        replaces = 1.0 if replacement_for & sub_tokens else 0.0
+        similarity = SequenceMatcher(None, service, sub_names).ratio()
+
+        score = 0.4 * savings + 0.3 * same_service + 0.2 * replaces + 0.1 * similarity
+        ranked.append((score, b))
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+def _same_service_downgrade(sub: Dict, ranked: List[tuple]) -> Optional[Dict]:
+    """
+    Builds a "Downgrade" verdict directly when a cheaper tier of the same service exists.
+    """
+    sub_names = " ".join(_normalize_service_name(n) for n in (sub["name"], sub.get("merchant_name")) if n)
+    same = [b for _, b in ranked if _is_same_service(_normalize_service_name(b["service_name"]), sub_names)]
+    if not same:
+        return None
+
+    best = min(same, key=lambda b: float(b["monthly_price"]))
+    price = float(sub["amount"])
+    alt_price = float(best["monthly_price"])
+    return {
+        "original": f"{sub['name']} - ${price:.2f}",
+        "alternative": f"{best['service_name']} ({best['tier_name']}) - ${alt_price:.2f}",
+        "monthly_savings": round(price - alt_price, 2),
+        "reason": f"Switch to the {best['tier_name']} plan of {best['service_name']} and keep the same service for less.",
+        "type": "Downgrade"
+    }
+
+def _is_same_service(service: str, sub_names: str) -> bool:
+    # Whole-word match so "Spotify" matches "spotify family" but "Hulu" doesn't match "hulul"
+    return bool(service) and f" {service} " in f" {sub_names} "
+
+def _compact_benchmark(b: Dict) -> Dict:
+    # Only what the model needs to judge a substitute
+    compact = {"service": b["service_name"], "tier": b["tier_name"], "price": float(b["monthly_price"])}
+    if b.get("features"):
+        compact["features"] = b["features"]
+    return compact
+
+def _normalize_service_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", (name or "").lower()).strip()
+
+def _analyze_bargain_opportunity(sub: Dict, benchmarks: List[Dict], strict: bool = False) -> Optional[Dict]:
     """
     Uses LLM to compare current subscription vs benchmarks from the knowledge base.
+    Returns None when there is no worthwhile alternative. With strict=True, LLM
+    errors are raised instead of also being reported as None.
     """
     
     current_svc = {
@@ -106,15 +276,23 @@ def _analyze_bargain_opportunity(sub: Dict, benchmarks: List[Dict]) -> Optional[
     
     if not cheaper_options:
         return None
+    
+    # Rank locally; a cheaper tier of the very same service needs no LLM judgement
+    ranked = _rank_candidates(sub, cheaper_options)
+    downgrade = _same_service_downgrade(sub, ranked)
+    if downgrade:
+        return downgrade
+    
+    shortlist = [_compact_benchmark(b) for _, b in ranked[:BARGAIN_TOP_K]]
         
     prompt = f"""
     You are a savvy financial cost optimization assistant.
     
     Current Subscription:
-    {json.dumps(current_svc, indent=2)}
+    {json.dumps(current_svc, separators=(",", ":"))}
     
-    Available Cheaper Alternatives (Knowledge Base):
-    {json.dumps(cheaper_options, indent=2)}
+    Available Cheaper Alternatives (Knowledge Base, best matches first):
+    {json.dumps(shortlist, separators=(",", ":"))}
     
     Task:
     Analyze the alternatives to find a VALID substitute. Look for:
@@ -140,25 +318,17 @@ def _analyze_bargain_opportunity(sub: Dict, benchmarks: List[Dict]) -> Optional[
     """
     
     try:
-        completion = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful JSON-speaking financial assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        content = completion.choices[0].message.content
-        result = json.loads(content)
+        result = chat_json("bargain", prompt)
         
         if result.get("monthly_savings", 0) > 0:
             return result
         return None
         
+    except LLMRateLimitError:
+        # Retries already happened in the gateway; let the caller know
+        raise
     except Exception as e:
         print(f"Error analyzing bargain for {sub['name']}: {e}")
-        # If rate limited, we should probably raise so the caller knows
-        if "rate_limit_exceeded" in str(e):
-             raise Exception("Groq API rate limit exceeded")
+        if strict:
+            raise
         return None
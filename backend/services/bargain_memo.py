@@ -0,0 +1,87 @@
+import os
+import re
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import List, Dict
+from supabase import Client
+from services.ttl_cache import TTLCache
+from services.metrics import observe_cache
+
+# Prices within the same bucket share a verdict (0.01 = exact price match)
+PRICE_BUCKET = float(os.getenv("BARGAIN_PRICE_BUCKET", "0.01"))
+# Verdicts are re-asked after this long even if the benchmarks didn't change
+MEMO_MAX_AGE = timedelta(days=int(os.getenv("BARGAIN_MEMO_MAX_AGE_DAYS", "7")))
+
+_local = TTLCache(maxsize=5000, ttl=3600)
+
+def memo_key(sub: Dict, benchmarks: List[Dict]) -> str:
+    """
+    Builds the shared key for a bargain verdict:
+    normalized service name | price bucket | hash of the candidate benchmark set.
+    """
+    service = re.sub(r"[^a-z0-9]+", " ", sub["name"].lower()).strip()
+    bucket = round(round(float(sub["amount"]) / PRICE_BUCKET) * PRICE_BUCKET, 2)
+
+    candidate_set = sorted(
+        (b["service_name"], b["tier_name"], float(b["monthly_price"]), json.dumps(b.get("features"), sort_keys=True))
+        for b in benchmarks
+    )
+    digest = hashlib.sha1(json.dumps(candidate_set).encode()).hexdigest()[:16]
+    return f"{service}|{bucket:.2f}|{digest}"
+
+def get_verdicts(keys: List[str], supabase: Client) -> Dict[str, Dict]:
+    """
+    Returns {memo_key: verdict} for keys with a cached verdict (verdict may be None).
+    """
+    found = _lookup(keys, supabase)
+    observe_cache("bargain_verdicts", "hit", len(found))
+    observe_cache("bargain_verdicts", "miss", len(set(keys)) - len(found))
+    return found
+
+def _lookup(keys: List[str], supabase: Client) -> Dict:
+    found = {}
+    misses = []
+    for key in set(keys):
+        entry = _local.get(key)
+        if entry is not None:
+            found[key] = entry["verdict"]
+        else:
+            misses.append(key)
+
+    if not misses:
+        return found
+
+    cutoff = (datetime.now() - MEMO_MAX_AGE).isoformat()
+    try:
+        response = supabase.table("bargain_verdicts") \
+            .select("memo_key, verdict") \
+            .in_("memo_key", misses) \
+            .gte("created_at", cutoff) \
+            .execute()
+    except Exception as e:
+        print(f"Bargain memo lookup failed: {e}")
+        return found
+
+    for row in response.data:
+        _local.set(row["memo_key"], {"verdict": row["verdict"]})
+        found[row["memo_key"]] = row["verdict"]
+    return found
+
+def store_verdicts(verdicts: Dict[str, Dict], supabase: Client):
+    """
+    Saves freshly computed verdicts (None included) in one upsert.
+    """
+    if not verdicts:
+        return
+
+    now = datetime.now().isoformat()
+    rows = []
+    for key, verdict in verdicts.items():
+        _local.set(key, {"verdict": verdict})
+        rows.append({"memo_key": key, "verdict": verdict, "created_at": now})
+
+    try:
+        supabase.table("bargain_verdicts").upsert(rows, on_conflict="memo_key").execute()
+    except Exception as e:
+        print(f"Failed to store bargain verdicts: {e}")
@@ -0,0 +1,217 @@
+import os
+import re
+import time
+import uuid
+import threading
+from datetime import datetime
+from collections import defaultdict
+from typing import List, Dict, Iterable, Optional
+from supabase import Client
+from services.metrics import observe_cache
+
+# Hard expiry for a cached category, even if nobody bumped its version
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", "3600"))
+# How often a cached category re-checks its version (one tiny query for all categories)
+CATALOG_REVALIDATE_SECONDS = int(os.getenv("CATALOG_REVALIDATE_SECONDS", "60"))
+# Rows per request when scanning the whole catalog
+CATALOG_PAGE_SIZE = 1000
+
+# Key used for the full-catalog entry and its version row
+ALL_CATEGORIES = "*"
+
+class BenchmarkCatalog:
+    """
+    Process-wide read-through cache of market_benchmarks, per category.
+    Entries expire after CATALOG_TTL_SECONDS and are revalidated against
+    benchmark_catalog_versions every CATALOG_REVALIDATE_SECONDS, so a version
+    bump from any worker is picked up without reloading unchanged categories.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+
+    def get_benchmarks(self, categories: Iterable[str], supabase: Client) -> Dict[str, List[Dict]]:
+        """
+        Returns {category: benchmarks} for the given categories.
+        """
+        categories = [c for c in set(categories) if c]
+        result, stale = self._lookup(categories, supabase)
+
+        if stale:
+            versions = self._fetch_versions(stale, supabase)
+            response = supabase.table("market_benchmarks") \
+                .select("*") \
+                .in_("category", stale) \
+                .execute()
+
+            loaded = defaultdict(list)
+            for b in response.data:
+                loaded[b["category"]].append(b)
+
+            for category in stale:
+                self._store(category, loaded[category], versions.get(category))
+                result[category] = loaded[category]
+
+        return result
+
+    def get_all(self, supabase: Client) -> List[Dict]:
+        """
+        Returns the whole catalog (used for name matching across categories).
+        """
+        result, stale = self._lookup([ALL_CATEGORIES], supabase)
+        if not stale:
+            return result[ALL_CATEGORIES]
+
+        versions = self._fetch_versions([ALL_CATEGORIES], supabase)
+        rows = []
+        start = 0
+        while True:
+            response = supabase.table("market_benchmarks") \
+                .select("*") \
+                .order("id") \
+                .range(start, start + CATALOG_PAGE_SIZE - 1) \
+                .execute()
+            rows.extend(response.data)
+            if len(response.data) < CATALOG_PAGE_SIZE:
+                break
+            start += CATALOG_PAGE_SIZE
+
+        self._store(ALL_CATEGORIES, rows, versions.get(ALL_CATEGORIES))
+        return rows
+
+    def invalidate(self, category: str, supabase: Client):
+        """
+        Drops the local copy and bumps the shared version so other workers reload too.
+        """
+        with self.lock:
+            self.entries.pop(category, None)
+            self.entries.pop(ALL_CATEGORIES, None)
+
+        now = datetime.now().isoformat()
+        version = uuid.uuid4().hex
+        try:
+            supabase.table("benchmark_catalog_versions").upsert([
+                {"category": category, "version": version, "updated_at": now},
+                {"category": ALL_CATEGORIES, "version": version, "updated_at": now}
+            ], on_conflict="category").execute()
+        except Exception as e:
+            # Other workers will still converge once their TTL runs out
+            print(f"[BenchmarkCatalog] Failed to bump version for '{category}': {e}")
+
+    def _lookup(self, categories: List[str], supabase: Client):
+        # Split into cached results and categories that need a (re)load
+        now = time.monotonic()
+        result = {}
+        stale = []
+        to_check = []
+
+        with self.lock:
+            for category in categories:
+                entry = self.entries.get(category)
+                if not entry or now - entry["loaded_at"] > CATALOG_TTL_SECONDS:
+                    stale.append(category)
+                elif now - entry["checked_at"] > CATALOG_REVALIDATE_SECONDS:
+                    to_check.append(category)
+                else:
+                    result[category] = entry["rows"]
+
+        if to_check:
+            versions = self._fetch_versions(to_check, supabase)
+            with self.lock:
+                for category in to_check:
+                    entry = self.entries.get(category)
+                    if entry and entry["version"] == versions.get(category):
+                        entry["checked_at"] = now
+                        result[category] = entry["rows"]
+                    else:
+                        stale.append(category)
+
+        observe_cache("benchmark_catalog", "hit", len(result))
+        observe_cache("benchmark_catalog", "miss", len(stale))
+        return result, stale
+
+    def _fetch_versions(self, categories: List[str], supabase: Client) -> Dict[str, str]:
+        # Read before loading rows, so a bump that races with the load is seen next time
+        try:
+            response = supabase.table("benchmark_catalog_versions") \
+                .select("category, version") \
+                .in_("category", categories) \
+                .execute()
+            return {row["category"]: row["version"] for row in response.data}
+        except Exception as e:
+            print(f"[BenchmarkCatalog] version check failed: {e}")
+            return {}
+
+    def _store(self, category: str, rows: List[Dict], version: str):
+        now = time.monotonic()
+        with self.lock:
+            self.entries[category] = {
+                "rows": rows,
+                "version": version,
+                "loaded_at": now,
+                "checked_at": now
+            }
+
+catalog = BenchmarkCatalog()
+
+BENCHMARK_COLUMNS = ("service_name", "tier_name", "monthly_price", "category", "features")
+
+def upsert_benchmarks(benchmarks: List[Dict], supabase: Client) -> int:
+    """
+    Writes benchmarks in one upsert keyed on (service_name, tier_name).
+    Existing tiers get their price, features and created_at refreshed but keep
+    their category. Rows without a usable price are skipped, not the batch.
+    Bumps the catalog version of every touched category. Returns rows written.
+    """
+    now = datetime.now().isoformat()
+    rows = {}
+    for b in benchmarks:
+        price = _parse_price(b.get("monthly_price"))
+        if not b.get("service_name") or not b.get("tier_name") or price is None:
+            print(f"[BenchmarkCatalog] Skipping incomplete benchmark: {b}")
+            continue
+        row = {c: b.get(c) for c in BENCHMARK_COLUMNS}
+        row["monthly_price"] = price
+        row["created_at"] = now
+        # The same tier twice in one statement would make Postgres reject the batch
+        rows[(row["service_name"], row["tier_name"])] = row
+
+    if not rows:
+        return 0
+
+    # A tier researched under another category stays where it is, so that
+    # category's cached rows never go stale without a version bump
+    existing = supabase.table("market_benchmarks") \
+        .select("service_name, tier_name, category") \
+        .in_("service_name", list({name for name, _ in rows})) \
+        .execute()
+    for current in existing.data:
+        row = rows.get((current["service_name"], current["tier_name"]))
+        if row is not None and current.get("category"):
+            row["category"] = current["category"]
+
+    supabase.table("market_benchmarks") \
+        .upsert(list(rows.values()), on_conflict="service_name,tier_name") \
+        .execute()
+
+    for category in set(row["category"] for row in rows.values() if row["category"]):
+        catalog.invalidate(category, supabase)
+
+    return len(rows)
+
+def _parse_price(value) -> Optional[float]:
+    # LLM output may say 9.99, "9.99", "$9.99/mo" or "Free"
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        price = float(value)
+    elif isinstance(value, str):
+        if value.strip().lower() == "free":
+            return 0.0
+        match = re.search(r"\d+(?:\.\d+)?", value.replace(",", ""))
+        if not match:
+            return None
+        price = float(match.group())
+    else:
+        return None
+    return round(price, 2) if price >= 0 else None
@@ -1,48 +1,129 @@
 import os
 import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Iterable
 from collections import defaultdict
-from groq import Groq
 from supabase import Client
+from services.llm_gateway import chat_json
+from services.recurrence import analyze_recurrence
+from services.merchant_cache import get_classifications, store_classifications
+from services.merchant_clustering import canonical_merchant, cluster_keys
+from services.fingerprints import compute_fingerprint, load_fingerprints, store_fingerprints
+from services.transaction_loader import stream_transactions
 
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+# Candidate groups packed into one classification prompt (1 = one call per merchant)
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", "8"))
 
-# Llama 3 model (Updated to 3.3 Versatile as 3.0 is decommissioned)
-MODEL = "llama-3.3-70b-versatile"
-
-def detect_subscriptions(user_id: str, supabase: Client):
+def detect_subscriptions(user_id: str, supabase: Client, progress: Optional[Callable] = None, on_verdict: Optional[Callable] = None, allow_llm: bool = True):
     """
     Main function to detect subscriptions for a user.
     1. Fetch transactions
     2. Group by merchant
     3. Filter candidates
-    4. Analyze with LLM
-    5. Save results
+    4. Skip groups unchanged since the last run
+    5. Score recurrence locally (reject clear non-schedules)
+    6. Name and categorize the rest (shared cache first, then LLM)
+    7. Save results
+    If given, progress(stage, done, total) is called as the pipeline advances,
+    and on_verdict(merchant, verdict, source) as each candidate group is decided
+    (source: "previous", "local", "cache" or "llm").
+    With allow_llm=False, groups missing from the merchant cache stay undecided
+    (not saved, not deactivated) and are retried on the next run.
     """
+    if progress is None:
+        progress = lambda stage, done=0, total=0: None
+    if on_verdict is None:
+        on_verdict = lambda merchant, verdict, source: None
+
+    progress("fetching")
     print(f"Detecting subscriptions for user {user_id}...")
     
-    # 1. Fetch transactions (last 6 months)
-    six_months_ago = (datetime.now() - timedelta(days=180)).date().isoformat()
-    
-    response = supabase.table("transactions") \
-        .select("*") \
-        .eq("user_id", user_id) \
-        .gte("date", six_months_ago) \
-        .execute()
-        
-    transactions = response.data
+    # 1-3. Fetch transactions, group by merchant, keep candidates
+    groups, candidates = load_candidates(user_id, supabase)
     
-    if not transactions:
+    if not groups:
         print("No transactions found.")
         return []
+    
+    progress("grouped", 0, len(candidates))
+    
+    # 4. Reuse last run's verdict for groups whose transactions haven't changed
+    previous = load_fingerprints(user_id, supabase)
+    fingerprints = {c["merchant"]: compute_fingerprint(c["txs"]) for c in candidates}
+    verdicts = {}
+    changed = []
+    
+    for candidate in candidates:
+        prev = previous.get(candidate["merchant"])
+        if prev and prev.get("verdict") and prev["fingerprint"] == fingerprints[candidate["merchant"]]["fingerprint"]:
+            verdicts[candidate["merchant"]] = prev["verdict"]
+            on_verdict(candidate["merchant"], prev["verdict"], "previous")
+        else:
+            changed.append(candidate)
+    
+    print(f"DEBUG: {len(verdicts)} unchanged groups reused, {len(changed)} new or changed")
+    
+    # 5. Score recurrence locally; rejected groups never reach the LLM
+    llm_candidates = []
+    
+    for candidate in changed:
+        result = screen_candidate(candidate)
+        if result is not None:
+            verdicts[candidate["merchant"]] = result
+            on_verdict(candidate["merchant"], result, "local")
+        else:
+            llm_candidates.append(candidate)
+    
+    # 6. Reuse verdicts any user already paid for, then analyze the rest with the LLM
+    resolved = len(candidates) - len(llm_candidates)
+    progress("analyzing", resolved, len(candidates))
+    frequencies = {c["merchant"]: c["frequency"] for c in llm_candidates}
+    
+    def on_result(merchant, result, source):
+        verdicts[merchant] = {**result, "frequency": frequencies[merchant]}
+        on_verdict(merchant, verdicts[merchant], source)
+    
+    classify_candidates(
+        llm_candidates,
+        supabase,
+        on_progress=lambda done, total: progress("analyzing", resolved + done, len(candidates)),
+        on_result=on_result,
+        allow_llm=allow_llm
+    )
+    
+    # Remember what each changed group looked like; failed LLM calls are retried next run
+    store_fingerprints(user_id, {
+        c["merchant"]: {**fingerprints[c["merchant"]], "verdict": verdicts[c["merchant"]]}
+        for c in changed
+        if c["merchant"] in verdicts
+    }, supabase)
+    
+    detected_subscriptions = [
+        {"original_group": merchant, **verdict}
+        for merchant, verdict in verdicts.items()
+        if verdict.get("is_subscription")
+    ]
+            
+    # 7. Reconcile against the user's saved subscriptions and write once
+    progress("saving", 0, len(detected_subscriptions))
+    summary = _reconcile_subscriptions(user_id, detected_subscriptions, groups, set(verdicts), supabase)
+            
+    return {"detected": len(detected_subscriptions), **summary, "reanalyzed": len(changed)}
 
-    # 2. Group by merchant/description (Deterministic Step)
-    groups = _group_transactions(transactions)
+def load_candidates(user_id: str, supabase: Client) -> tuple:
+    """
+    Streams the user's last 6 months of transactions (only the columns detection
+    needs, page by page) and groups them by merchant as they arrive.
+    Returns (groups, candidates) where candidates are the groups with at least 2 charges.
+    """
+    six_months_ago = (datetime.now() - timedelta(days=180)).date().isoformat()
+    
+    # Group by merchant/description (Deterministic Step)
+    groups = _group_transactions(stream_transactions(user_id, six_months_ago, supabase))
+    if not groups:
+        return {}, []
     
-    # 3. Filter candidates (Must have at least 2 occurrences)
+    # Filter candidates (Must have at least 2 occurrences)
     candidates = [
         {"merchant": k, "txs": v} 
         for k, v in groups.items() 
@@ -50,66 +131,175 @@ def detect_subscriptions(user_id: str, supabase: Client):
     ]
     
     print(f"DEBUG: Found {len(candidates)} candidate groups: {[c['merchant'] for c in candidates]}")
+    return groups, candidates
+
+def summarize_candidate(candidate: Dict) -> Dict:
+    """
+    A compact copy of a candidate (merchant key plus date/amount/name per charge),
+    small enough to hold for many users at once; classify_candidates accepts it.
+    """
+    return {"merchant": candidate["merchant"], "txs": _simplify_txs(candidate["txs"])}
+
+def screen_candidate(candidate: Dict) -> Optional[Dict]:
+    """
+    Scores a candidate's recurrence locally and sets candidate["frequency"]
+    (and candidate["recurrence_score"] when it is clearly recurring).
+    Returns a verdict for groups that are clearly not a schedule, or None when
+    the group still needs a name and category from the cache or the LLM.
+    """
+    recurrence = analyze_recurrence(candidate["txs"])
+    candidate["frequency"] = recurrence["cadence"] or "monthly"
+    print(f"DEBUG: Recurrence for {candidate['merchant']}: {recurrence}")
     
-    # 4. Analyze with LLM
-    detected_subscriptions = []
+    if recurrence["decision"] == "reject":
+        return {"is_subscription": False}
+    if recurrence["decision"] == "accept":
+        candidate["recurrence_score"] = recurrence["score"]
+    return None
+
+def classify_candidates(candidates: List[Dict], supabase: Client, on_progress: Optional[Callable] = None, on_result: Optional[Callable] = None, allow_llm: bool = True) -> Dict[str, Dict]:
+    """
+    Classifies candidate groups by merchant key: shared merchant cache first,
+    then the LLM in batches of DETECTION_BATCH_SIZE. Fresh verdicts are written
+    back to the cache. Returns {merchant: verdict}; failed LLM calls are left out.
+    If given, on_progress(done, total) is called as LLM answers come in, and
+    on_result(merchant, verdict, source) for every verdict ("cache" or "llm").
+    With allow_llm=False only the cache is used and misses are left out.
+    """
+    if on_progress is None:
+        on_progress = lambda done, total: None
+    if on_result is None:
+        on_result = lambda merchant, verdict, source: None
     
-    for candidate in candidates:
-        print(f"DEBUG: Analyzing candidate: {candidate['merchant']} with {len(candidate['txs'])} txs")
-        result = _analyze_with_llm(candidate)
-        print(f"DEBUG: LLM Result for {candidate['merchant']}: {result}")
-        
-        if result and result.get("is_subscription"):
-            detected_subscriptions.append({
-                "original_group": candidate["merchant"],
-                **result
-            })
+    by_merchant = {c["merchant"]: c for c in candidates}
+    verdicts = get_classifications(list(by_merchant), supabase)
+    verdicts = {merchant: _with_recurrence(by_merchant[merchant], v) for merchant, v in verdicts.items()}
+    for merchant, verdict in verdicts.items():
+        on_result(merchant, verdict, "cache")
+    llm_candidates = [c for c in candidates if c["merchant"] not in verdicts]
+    if not allow_llm:
+        print(f"DEBUG: {len(verdicts)} merchant verdicts from cache, {len(llm_candidates)} left for a later run")
+        return verdicts
+    print(f"DEBUG: {len(verdicts)} merchant verdicts from cache, {len(llm_candidates)} need the LLM")
+    
+    done = len(candidates) - len(llm_candidates)
+    fresh_verdicts = {}
+    
+    for start in range(0, len(llm_candidates), DETECTION_BATCH_SIZE):
+        batch = llm_candidates[start:start + DETECTION_BATCH_SIZE]
+        batch_results = _analyze_batch_with_llm(batch) if len(batch) > 1 else {}
+
+        for candidate in batch:
+            print(f"DEBUG: Analyzing candidate: {candidate['merchant']} with {len(candidate['txs'])} txs")
+            if candidate["merchant"] in batch_results:
+                result = batch_results[candidate["merchant"]]
+            else:
+                # Single candidate, or the batch answer was missing/malformed for it
+                result = _analyze_with_llm(candidate)
+            print(f"DEBUG: LLM Result for {candidate['merchant']}: {result}")
             
-    # 5. Save to DB
-    saved_count = 0
-    for sub in detected_subscriptions:
-        # Determine average amount
+            if result:
+                fresh_verdicts[candidate["merchant"]] = result
+                verdicts[candidate["merchant"]] = _with_recurrence(candidate, result)
+                on_result(candidate["merchant"], verdicts[candidate["merchant"]], "llm")
+            done += 1
+            on_progress(done, len(candidates))
+    
+    # The cache keeps the model's own answer; the recurrence override is per group
+    store_classifications(fresh_verdicts, supabase)
+    return verdicts
+
+def _with_recurrence(candidate: Dict, verdict: Dict) -> Dict:
+    """
+    A clearly recurring group (see screen_candidate) is a subscription whatever
+    the model said, as long as the verdict gives it a name to save under.
+    """
+    score = candidate.get("recurrence_score")
+    if score is None or not verdict.get("normalized_name"):
+        return verdict
+    return {**verdict, "is_subscription": True, "confidence": max(verdict.get("confidence") or 0, score)}
+
+def _reconcile_subscriptions(user_id: str, detected: List[Dict], groups: Dict[str, List[Dict]], decided: set, supabase: Client) -> Dict:
+    """
+    Diffs detected subscriptions against the saved ones in memory and writes
+    all inserts, updates and deactivations as one upsert on (user_id, name).
+    A saved subscription is only deactivated when its merchant group was decided
+    this run (judged not a subscription, or saved under another name). Groups
+    that weren't classified (LLM error) or have aged out of the window, like a
+    quarterly charge with one payment in it, are left untouched.
+    """
+    columns = ("name", "merchant_name", "amount", "category", "frequency", "is_active")
+    
+    # Several merchant groups can resolve to the same name; keep the busiest one
+    desired = {}
+    for sub in detected:
         txs = groups[sub["original_group"]]
-        amounts = [t["amount"] for t in txs]
-        avg_amount = sum(amounts) / len(amounts)
-        
-        # Determine frequency (simplistic)
-        frequency = "monthly" # Defaulting for now, could be improved with date math
+        name = sub["normalized_name"]
+        if name in desired and desired[name]["_tx_count"] >= len(txs):
+            continue
         
-        data = {
+        # Determine average amount
+        amounts = [t["amount"] for t in txs]
+        desired[name] = {
             "user_id": user_id,
-            "name": sub["normalized_name"],
+            "name": name,
             "merchant_name": sub["original_group"],
-            "amount": avg_amount,
+            "amount": round(sum(amounts) / len(amounts), 2),
             "category": sub["category"],
-            "frequency": frequency,
-            "is_active": True
+            # Cadence inferred from the gaps between charges
+            "frequency": sub.get("frequency") or "monthly",
+            "is_active": True,
+            "_tx_count": len(txs)
         }
-        
-        try:
-            # Upsert based on (user_id, name) or similar logic to avoid duplicates?
-            # For now, just insert. In real app, we'd check for existing active sub.
-            # Using name as unique constraint might be risky.
-            # Ideally we'd have a specialized ID logic.
-            # Let's check if one exists with same name.
-            existing = supabase.table("subscriptions").select("id").eq("user_id", user_id).eq("name", sub["normalized_name"]).execute()
-            
-            if existing.data:
-                print(f"Subscription {sub['normalized_name']} already exists.")
-            else:
-                supabase.table("subscriptions").insert(data).execute()
-                saved_count += 1
-                
-        except Exception as e:
-            print(f"Error saving subscription {sub['normalized_name']}: {e}")
-            
-    return {"detected": len(detected_subscriptions), "saved": saved_count}
+    
+    existing_response = supabase.table("subscriptions") \
+        .select(", ".join(columns)) \
+        .eq("user_id", user_id) \
+        .execute()
+    existing = {row["name"]: row for row in existing_response.data}
+    
+    rows = []
+    inserted = updated = deactivated = 0
+    
+    for name, row in desired.items():
+        row.pop("_tx_count")
+        current = existing.get(name)
+        if current is None:
+            inserted += 1
+        elif (
+            current.get("amount") is None
+            or round(float(current["amount"]), 2) != row["amount"]
+            or current.get("frequency") != row["frequency"]
+            or not current.get("is_active")
+        ):
+            # Keep the saved category/merchant label, only refresh what detection measures
+            row["category"] = current.get("category") or row["category"]
+            updated += 1
+        else:
+            continue
+        rows.append(row)
+    
+    for name, current in existing.items():
+        if name in desired or not current.get("is_active"):
+            continue
+        if current.get("merchant_name") not in decided:
+            continue
+        rows.append({"user_id": user_id, **{c: current.get(c) for c in columns}, "is_active": False})
+        deactivated += 1
+    
+    if rows:
+        supabase.table("subscriptions").upsert(rows, on_conflict="user_id,name").execute()
+    
+    print(f"Subscriptions reconciled: {inserted} new, {updated} updated, {deactivated} deactivated.")
+    return {"saved": inserted, "updated": updated, "deactivated": deactivated}
 
-def _group_transactions(transactions: List[Dict]) -> Dict[str, List[Dict]]:
+def _group_transactions(transactions: Iterable) -> Dict[str, List]:
     """
-    Groups transactions by a simplified merchant name.
+    Groups transactions (any iterable, consumed once) by a simplified merchant name.
     """
-    groups = defaultdict(list)
+    exact_groups = defaultdict(list)
+    # Raw merchant strings repeat a lot; normalize each distinct one once
+    canonical = {}
     
     for t in transactions:
         # Use merchant_name if available, else name
@@ -117,14 +307,19 @@ def _group_transactions(transactions: List[Dict]) -> Dict[str, List[Dict]]:
         if not key:
             continue
             
-        # Basic normalization: limit length, lowercase for key
-        # Remove common suffixes like "Inc", ".com", etc. for better grouping
-        key_normalized = key.strip().lower()
-        key_normalized = key_normalized.replace(".com", "").replace(" inc.", "").replace(" inc", "")
-        
-        # Simple clustering could go here (e.g. fuzzy match).
-        # For now, approximate string match on merchant/name.
-        groups[key_normalized].append(t)
+        # Normalization: lowercase, drop store numbers/phone digits and
+        # suffixes like "Inc", ".com" so variants land on one key
+        if key not in canonical:
+            canonical[key] = canonical_merchant(key)
+        exact_groups[canonical[key]].append(t)
+    
+    # Fuzzy pass: merge near-duplicate keys ("netflix" / "netflx") into one group
+    weights = {k: len(v) for k, v in exact_groups.items()}
+    mapping = cluster_keys(exact_groups.keys(), weights)
+    
+    groups = defaultdict(list)
+    for key, txs in exact_groups.items():
+        groups[mapping[key]].extend(txs)
         
     return groups
 
@@ -133,13 +328,7 @@ def _analyze_with_llm(candidate: Dict) -> Optional[Dict]:
     Sends a candidate group to Groq to determine if it's a subscription.
     """
     merchant = candidate["merchant"]
-    txs = candidate["txs"]
-    
-    # optimize payload
-    simplified_txs = [
-        {"date": t["date"], "amount": t["amount"], "name": t["name"]}
-        for t in txs
-    ]
+    simplified_txs = _simplify_txs(candidate["txs"])
     
     prompt = f"""
     You are a financial classifier. Analyze these transactions to see if they represent a recurring subscription.
@@ -157,18 +346,61 @@ def _analyze_with_llm(candidate: Dict) -> Optional[Dict]:
     """
     
     try:
-        completion = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful JSON-speaking financial assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        content = completion.choices[0].message.content
-        return json.loads(content)
+        return chat_json("detector", prompt)
         
     except Exception as e:
         print(f"LLM Error for {merchant}: {e}")
         return None
+
+def _analyze_batch_with_llm(candidates: List[Dict]) -> Dict[str, Dict]:
+    """
+    Classifies several candidate groups in a single Groq call.
+    Returns {merchant: result} for every candidate that came back well-formed;
+    callers fall back to _analyze_with_llm for anything missing.
+    """
+    # Short ids keep the response keys safe even for odd merchant strings
+    keyed = {f"c{i}": c for i, c in enumerate(candidates)}
+    payload = {
+        key: {"merchant": c["merchant"], "transactions": _simplify_txs(c["txs"])}
+        for key, c in keyed.items()
+    }
+
+    prompt = f"""
+    You are a financial classifier. For EACH merchant group below, decide whether its transactions represent a recurring subscription.
+    
+    Merchant groups (keyed by id):
+    {json.dumps(payload, separators=(",", ":"))}
+    
+    Return strictly JSON with a key "results" mapping EVERY id above to an object with these fields:
+    - is_subscription (bool)
+    - normalized_name (string, e.g. 'Netflix')
+    - category (string, e.g. 'Entertainment', 'Utilities', 'Software')
+    - confidence (float 0-1)
+    
+    If a group is NOT a subscription, set is_subscription to false.
+    """
+    
+    try:
+        data = chat_json("detector_batch", prompt)
+        results = data.get("results", data) if isinstance(data, dict) else {}
+        
+    except Exception as e:
+        print(f"LLM batch error for {len(candidates)} candidates, falling back to single calls: {e}")
+        return {}
+
+    parsed = {}
+    for key, candidate in keyed.items():
+        result = results.get(key) if isinstance(results, dict) else None
+        if not isinstance(result, dict) or "is_subscription" not in result:
+            continue
+        if result["is_subscription"] and not result.get("normalized_name"):
+            continue
+        parsed[candidate["merchant"]] = result
+    return parsed
+
+def _simplify_txs(txs: List[Dict]) -> List[Dict]:
+    # optimize payload
+    return [
+        {"date": t["date"], "amount": t["amount"], "name": t["name"]}
+        for t in txs
+    ]
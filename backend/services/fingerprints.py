@@ -0,0 +1,55 @@
+import hashlib
+from datetime import datetime
+from typing import List, Dict
+from supabase import Client
+
+def compute_fingerprint(txs: List[Dict]) -> Dict:
+    """
+    Summarizes a merchant group so a later run can tell whether it changed.
+    """
+    ids = sorted(str(t.get("id") or t.get("teller_transaction_id")) for t in txs)
+    amount_sum = round(sum(float(t["amount"]) for t in txs), 2)
+    last_date = max(str(t["date"]) for t in txs)
+
+    digest = hashlib.sha1()
+    digest.update("|".join(ids).encode())
+    digest.update(f"|{len(ids)}|{amount_sum}|{last_date}".encode())
+
+    return {
+        "fingerprint": digest.hexdigest(),
+        "tx_count": len(ids),
+        "amount_sum": amount_sum,
+        "last_date": last_date
+    }
+
+def load_fingerprints(user_id: str, supabase: Client) -> Dict[str, Dict]:
+    """
+    Returns {merchant_key: {"fingerprint", "verdict"}} from the user's previous runs.
+    """
+    try:
+        response = supabase.table("detection_fingerprints") \
+            .select("merchant_key, fingerprint, verdict") \
+            .eq("user_id", user_id) \
+            .execute()
+        return {row["merchant_key"]: row for row in response.data}
+    except Exception as e:
+        # Missing fingerprints only cost a full re-analysis
+        print(f"Failed to load detection fingerprints for {user_id}: {e}")
+        return {}
+
+def store_fingerprints(user_id: str, entries: Dict[str, Dict], supabase: Client):
+    """
+    Upserts {merchant_key: {**compute_fingerprint(...), "verdict": ...}} in one request.
+    """
+    if not entries:
+        return
+
+    now = datetime.now().isoformat()
+    rows = [
+        {"user_id": user_id, "merchant_key": key, "updated_at": now, **entry}
+        for key, entry in entries.items()
+    ]
+    try:
+        supabase.table("detection_fingerprints").upsert(rows, on_conflict="user_id,merchant_key").execute()
+    except Exception as e:
+        print(f"Failed to store detection fingerprints for {user_id}: {e}")
@@ -0,0 +1,150 @@
+import os
+import uuid
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs are kept around this long so clients can poll the result
+JOB_RETENTION = timedelta(hours=1)
+
+class JobRunner:
+    """
+    Small in-process job queue backed by a bounded thread pool.
+    Jobs are keyed (e.g. by user), so submitting the same key while a job is
+    queued or running returns the existing job instead of starting another.
+    Each job keeps an event log that callers read with events_since().
+    """
+    def __init__(self, max_workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Dict] = {}
+        self.active_by_key: Dict[str, str] = {}
+
+    def submit(self, key: str, owner: str, fn: Callable, *args) -> Dict:
+        """
+        Enqueues fn(*args, progress) unless a job for key is already active.
+        fn receives a progress(stage, done, total) callback as its last argument;
+        progress.publish(event) appends an event to the job's log.
+        """
+        with self.lock:
+            self._prune()
+
+            active_id = self.active_by_key.get(key)
+            if active_id:
+                return self._snapshot(self.jobs[active_id])
+
+            job_id = str(uuid.uuid4())
+            job = {
+                "job_id": job_id,
+                "key": key,
+                "owner": owner,
+                "status": "queued",
+                "progress": None,
+                "result": None,
+                "error": None,
+                "events": [],
+                "created_at": datetime.now(),
+                "finished_at": None
+            }
+            self.jobs[job_id] = job
+            self.active_by_key[key] = job_id
+
+        self.executor.submit(self._run, job, fn, args)
+        return self._snapshot(job)
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Dict]:
+        """
+        Returns a job snapshot, or None if it doesn't exist (or belongs to someone else).
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or (owner is not None and job["owner"] != owner):
+                return None
+            return self._snapshot(job)
+
+    def is_active(self, key: str) -> bool:
+        """
+        True while a job for key is queued or running.
+        """
+        with self.lock:
+            return key in self.active_by_key
+
+    def events_since(self, job_id: str, start: int) -> Optional[Tuple[List[Dict], bool]]:
+        """
+        Returns (events logged from index start on, whether the job has finished),
+        or None if the job doesn't exist. Never blocks, so async code can poll it.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return job["events"][start:], job["finished_at"] is not None
+
+    def last_finished(self, key: str) -> Optional[Dict]:
+        """
+        Returns a snapshot of the most recent finished job for key (kept for
+        JOB_RETENTION), or None.
+        """
+        with self.lock:
+            finished = [job for job in self.jobs.values() if job["key"] == key and job["finished_at"]]
+            if not finished:
+                return None
+            return self._snapshot(max(finished, key=lambda job: job["finished_at"]))
+
+    def _run(self, job: Dict, fn: Callable, args: tuple):
+        def publish(event: Dict):
+            with self.lock:
+                job["events"].append(event)
+
+        def progress(stage: str, done: int = 0, total: int = 0):
+            with self.lock:
+                job["progress"] = {"stage": stage, "done": done, "total": total}
+            publish({"event": "progress", "stage": stage, "done": done, "total": total})
+
+        progress.publish = publish
+
+        with self.lock:
+            job["status"] = "running"
+
+        try:
+            result = fn(*args, progress)
+            status, error = "completed", None
+        except Exception as e:
+            print(f"Job {job['job_id']} failed: {e}")
+            result, status, error = None, "failed", str(e)
+
+        with self.lock:
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = datetime.now()
+            if self.active_by_key.get(job["key"]) == job["job_id"]:
+                del self.active_by_key[job["key"]]
+
+    def _prune(self):
+        # Caller holds the lock
+        cutoff = datetime.now() - JOB_RETENTION
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job["finished_at"] and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _snapshot(self, job: Dict) -> Dict:
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "result": job["result"],
+            "error": job["error"],
+            "created_at": job["created_at"].isoformat(),
+            "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None
+        }
+
+# Shared runner for subscription detection jobs
+detection_jobs = JobRunner(max_workers=int(os.getenv("DETECTION_WORKERS", "2")))
+
+# Background stale-while-revalidate refreshes of the bargain cache
+bargain_refresh_jobs = JobRunner(max_workers=int(os.getenv("BARGAIN_REFRESH_WORKERS", "2")))
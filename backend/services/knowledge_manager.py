@@ -1,39 +1,79 @@
 import os
-import json
+import contextvars
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from groq import Groq
+from typing import List, Dict, Optional, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
 from supabase import Client
+from services.llm_gateway import chat_json
+from services.benchmark_catalog import catalog, upsert_benchmarks
+from services.profiling import traced
 
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+# Max categories researched at the same time
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", "4"))
 
-# Use a model capable of good JSON generation
-MODEL = "llama-3.3-70b-versatile"
+# Single-flight: category -> Future of the check/research currently running for it
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+def ensure_categories_knowledge(categories: Iterable[str], supabase: Client, max_workers: int = RESEARCH_CONCURRENCY):
+    """
+    Runs ensure_category_knowledge for several categories concurrently,
+    so a cold start costs one research round trip rather than one per category.
+    """
+    categories = [c for c in set(categories) if c]
+    if not categories:
+        return
+
+    workers = max(1, min(max_workers, len(categories)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(contextvars.copy_context().run, traced(ensure_category_knowledge), c, supabase) for c in categories]:
+            future.result()
 
 def ensure_category_knowledge(category: str, supabase: Client):
     """
     Checks if we have fresh benchmarks for this category.
     If not, uses AI to research and populate the database.
+    Concurrent callers for the same category share a single check/research run.
     """
     if not category:
         return
 
+    with _inflight_lock:
+        future = _inflight.get(category)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[category] = future
+
+    if not leader:
+        # Someone else is already on it; wait for their result
+        return future.result()
+
+    try:
+        future.set_result(_ensure_category_knowledge(category, supabase))
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(category, None)
+
+    return future.result()
+
+def _ensure_category_knowledge(category: str, supabase: Client):
+    """
+    Freshness check + AI research for one category (call through ensure_category_knowledge).
+    """
     # print(f"[KnowledgeManager] Checking knowledge for category: '{category}'...")
 
     # 1. Check existing freshness
     # We look for ANY benchmark in this category created/updated recently.
     try:
-        response = supabase.table("market_benchmarks") \
-            .select("created_at") \
-            .eq("category", category) \
-            .order("created_at", desc=True) \
-            .limit(1) \
-            .execute()
+        benchmarks = catalog.get_benchmarks([category], supabase).get(category, [])
             
-        if response.data:
-            last_created = response.data[0]['created_at']
+        if benchmarks:
+            last_created = max(b['created_at'] for b in benchmarks)
             # Parse timestamp (Simple ISO format often works, but handle Z)
             last_created_dt = datetime.fromisoformat(last_created.replace('Z', '+00:00'))
             
@@ -51,24 +91,13 @@ def ensure_category_knowledge(category: str, supabase: Client):
     if new_benchmarks:
         print(f"[KnowledgeManager] Found {len(new_benchmarks)} items. Updating database...")
         
-        # 3. Insert into Database
-        count = 0
-        for b in new_benchmarks:
-            try:
-                # Avoid exact duplicates
-                existing = supabase.table("market_benchmarks") \
-                    .select("id") \
-                    .eq("service_name", b["service_name"]) \
-                    .eq("tier_name", b["tier_name"]) \
-                    .execute()
-                    
-                if not existing.data:
-                    supabase.table("market_benchmarks").insert(b).execute()
-                    count += 1
-            except Exception as e:
-                print(f"Error inserting benchmark {b.get('service_name')}: {e}")
-        
-        print(f"[KnowledgeManager] Database updated with {count} new benchmarks for '{category}'.")
+        # 3. Upsert into Database (refreshes prices of tiers we already know)
+        try:
+            # New tiers are filed under this category (known tiers keep their own)
+            count = upsert_benchmarks([{**b, "category": category} for b in new_benchmarks], supabase)
+            print(f"[KnowledgeManager] Database updated with {count} benchmarks for '{category}'.")
+        except Exception as e:
+            print(f"[KnowledgeManager] Error saving benchmarks for '{category}': {e}")
 
 def _research_category(category: str) -> List[Dict]:
     """
@@ -100,16 +129,7 @@ def _research_category(category: str) -> List[Dict]:
     """
     
     try:
-        completion = client.chat.completions.create(
-             model=MODEL,
-             messages=[
-                 {"role": "system", "content": "You are a helpful JSON-speaking market researcher."},
-                 {"role": "user", "content": prompt}
-             ],
-             response_format={"type": "json_object"}
-         )
-        content = completion.choices[0].message.content
-        data = json.loads(content)
+        data = chat_json("research", prompt, system="You are a helpful JSON-speaking market researcher.")
         
         if "benchmarks" in data:
             return data["benchmarks"]
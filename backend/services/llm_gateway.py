@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import random
+from typing import Dict, Optional
+from groq import Groq
+from services.rate_limiter import groq_limiter, estimate_tokens
+from services.metrics import observe_llm
+from services.profiling import record_span
+
+# Initialize the one Groq client for the whole process (its HTTP pool is shared)
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+client = Groq(api_key=GROQ_API_KEY, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+
+# Llama 3 model (Updated to 3.3 Versatile as 3.0 is decommissioned)
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful JSON-speaking financial assistant."
+
+class LLMError(Exception):
+    pass
+
+class LLMRateLimitError(LLMError):
+    def __init__(self, message: str = "Groq API rate limit exceeded"):
+        super().__init__(message)
+
+def model_for(call_site: str) -> str:
+    """
+    Model for a call site: LLM_MODEL_<CALL_SITE> (e.g. LLM_MODEL_BARGAIN) or the default.
+    """
+    return os.getenv(f"LLM_MODEL_{call_site.upper()}", DEFAULT_MODEL)
+
+def chat_json(call_site: str, prompt: str, system: str = DEFAULT_SYSTEM_PROMPT, model: Optional[str] = None, timeout: Optional[float] = None, max_retries: int = LLM_MAX_RETRIES) -> Dict:
+    """
+    Sends one JSON-mode chat completion and returns the parsed object.
+    Goes through the shared rate limiter, retries transient errors and 429s
+    with jittered exponential backoff, and records metrics under call_site.
+    Raises LLMRateLimitError if still rate limited, LLMError for anything else.
+    """
+    model = model or model_for(call_site)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt}
+    ]
+
+    for attempt in range(max_retries + 1):
+        if not groq_limiter.acquire(estimate_tokens(system, prompt)):
+            observe_llm(call_site, 0.0, "error")
+            raise LLMRateLimitError("Groq API rate limit exceeded (local budget exhausted)")
+
+        started = time.monotonic()
+        try:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                timeout=timeout or LLM_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            observe_llm(call_site, time.monotonic() - started, "error")
+            record_span("groq", f"{call_site} (error)", time.monotonic() - started)
+            rate_limited = _is_rate_limit(e)
+
+            if attempt < max_retries and (rate_limited or _is_transient(e)):
+                delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt))
+                delay = random.uniform(delay / 2, delay)
+                print(f"[LLM:{call_site}] {type(e).__name__}, retrying in {delay:.1f}s: {e}")
+                if rate_limited:
+                    # Pause every caller, not just this one
+                    groq_limiter.backoff(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            if rate_limited:
+                raise LLMRateLimitError() from e
+            raise LLMError(f"{call_site} LLM call failed: {e}") from e
+
+        completion_usage = getattr(completion, "usage", None)
+        observe_llm(
+            call_site,
+            time.monotonic() - started,
+            "ok",
+            getattr(completion_usage, "prompt_tokens", 0) or 0,
+            getattr(completion_usage, "completion_tokens", 0) or 0
+        )
+        record_span("groq", call_site, time.monotonic() - started)
+
+        content = completion.choices[0].message.content
+        try:
+            return json.loads(content)
+        except ValueError as e:
+            raise LLMError(f"{call_site} returned invalid JSON: {e}") from e
+
+def _is_rate_limit(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or "rate_limit_exceeded" in str(e)
+
+def _is_transient(e: Exception) -> bool:
+    # Timeouts, dropped connections and 5xx are worth another try; 4xx are not
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return "timeout" in type(e).__name__.lower() or "connection" in type(e).__name__.lower()
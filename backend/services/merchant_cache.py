@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict
+from supabase import Client
+from services.ttl_cache import TTLCache
+from services.metrics import observe_cache
+
+# Verdicts older than this are re-classified (merchants do rebrand / change model)
+MERCHANT_CACHE_MAX_AGE = timedelta(days=int(os.getenv("MERCHANT_CACHE_MAX_AGE_DAYS", "30")))
+
+# In-process copy so hot merchants (netflix, spotify...) skip the DB too
+_local = TTLCache(maxsize=5000, ttl=3600)
+
+CACHED_FIELDS = ("is_subscription", "normalized_name", "category", "confidence")
+
+def get_classifications(merchant_keys: List[str], supabase: Client) -> Dict[str, Dict]:
+    """
+    Looks up cached LLM verdicts for normalized merchant keys.
+    Checks the in-process LRU first, then fetches the misses in one query.
+    Returns {merchant_key: verdict} for the keys that were found.
+    """
+    found = _lookup(merchant_keys, supabase)
+    observe_cache("merchant_classifications", "hit", len(found))
+    observe_cache("merchant_classifications", "miss", len(set(merchant_keys)) - len(found))
+    return found
+
+def _lookup(merchant_keys: List[str], supabase: Client) -> Dict:
+    found = {}
+    misses = []
+    for key in merchant_keys:
+        verdict = _local.get(key)
+        if verdict is not None:
+            found[key] = verdict
+        else:
+            misses.append(key)
+
+    if not misses:
+        return found
+
+    cutoff = (datetime.now() - MERCHANT_CACHE_MAX_AGE).isoformat()
+    try:
+        response = supabase.table("merchant_classifications") \
+            .select("merchant_key, " + ", ".join(CACHED_FIELDS)) \
+            .in_("merchant_key", misses) \
+            .gte("updated_at", cutoff) \
+            .execute()
+    except Exception as e:
+        print(f"Merchant cache lookup failed: {e}")
+        return found
+
+    for row in response.data:
+        verdict = {field: row[field] for field in CACHED_FIELDS}
+        _local.set(row["merchant_key"], verdict)
+        found[row["merchant_key"]] = verdict
+
+    return found
+
+def store_classifications(verdicts: Dict[str, Dict], supabase: Client):
+    """
+    Writes fresh LLM verdicts back to both cache tiers in a single upsert.
+    """
+    if not verdicts:
+        return
+
+    now = datetime.now().isoformat()
+    rows = []
+    for key, verdict in verdicts.items():
+        verdict = {field: verdict.get(field) for field in CACHED_FIELDS}
+        verdict["is_subscription"] = bool(verdict["is_subscription"])
+        _local.set(key, verdict)
+        rows.append({"merchant_key": key, "updated_at": now, **verdict})
+
+    try:
+        supabase.table("merchant_classifications").upsert(rows, on_conflict="merchant_key").execute()
+    except Exception as e:
+        print(f"Failed to store merchant classifications: {e}")
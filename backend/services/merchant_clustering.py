@@ -0,0 +1,105 @@
+import re
+from collections import defaultdict, Counter
+from difflib import SequenceMatcher
+from typing import Dict, Iterable
+
+# Tokens that say nothing about who the merchant is
+NOISE_TOKENS = {
+    "com", "www", "http", "https", "net", "org", "inc", "llc", "ltd", "co", "corp",
+    "the", "pos", "ach", "debit", "credit", "card", "purchase", "payment", "recurring",
+    "online", "bill", "autopay", "us", "usa",
+}
+
+# Trigram blocking only proposes pairs; a pair is merged when the strings
+# (spaces removed) are at least this similar by edit-based ratio.
+# netflix/netflx = 0.92, spotify premium/spotify premum = 0.97, disney plus/disneyplus = 1.0
+SIMILARITY_THRESHOLD = 0.85
+# Share of the shorter key's trigrams two keys must have in common to be compared at all
+MIN_TRIGRAM_CONTAINMENT = 0.5
+# Shorter keys only merge when identical without spaces (lyft/lift, hulu/hula are different merchants)
+MIN_FUZZY_LENGTH = 5
+# Trigrams shared by more keys than this are too common to block on
+# (keeps the candidate search sub-quadratic on large, messy histories)
+MAX_POSTING_SIZE = 50
+
+def canonical_merchant(raw: str) -> str:
+    """
+    Reduces a raw merchant/description string to its identifying words,
+    e.g. "NETFLIX.COM 866-579" -> "netflix", "Spotify USA Inc." -> "spotify".
+    Letters joined by "&" or "-" stay one word ("AT&T" -> "att", "T-Mobile" -> "tmobile")
+    so single letters in names survive the one-letter filter.
+    """
+    text = raw.lower().replace(".com", " ")
+    text = re.sub(r"(?<=[a-z])[&-](?=[a-z])", "", text)
+    tokens = re.findall(r"[a-z]+", text)
+    tokens = [t for t in tokens if t not in NOISE_TOKENS and len(t) > 1]
+    if not tokens:
+        # Nothing left (e.g. only digits/noise): fall back to the trimmed original
+        return raw.strip().lower()
+    return " ".join(tokens)
+
+def cluster_keys(keys: Iterable[str], weights: Dict[str, int] = None) -> Dict[str, str]:
+    """
+    Merges near-duplicate canonical keys: trigram blocking finds candidate pairs,
+    which are then verified by edit similarity of the space-stripped strings.
+    Returns {key: representative} where the representative is the heaviest key
+    of its cluster (by weights, e.g. transaction counts).
+    """
+    keys = list(dict.fromkeys(keys))
+    weights = weights or {}
+    shingles = {k: _trigrams(k) for k in keys}
+
+    index = defaultdict(list)
+    for k in keys:
+        for g in shingles[k]:
+            index[g].append(k)
+
+    parent = {k: k for k in keys}
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for k in keys:
+        # Count shared (non-common) trigrams with every key in the same blocks
+        overlaps = Counter()
+        for g in shingles[k]:
+            posting = index[g]
+            if len(posting) > MAX_POSTING_SIZE:
+                continue
+            for other in posting:
+                if other > k:
+                    overlaps[other] += 1
+
+        for other, shared in overlaps.items():
+            smaller = min(len(shingles[k]), len(shingles[other]))
+            if shared / smaller < MIN_TRIGRAM_CONTAINMENT or not _similar(k, other):
+                continue
+            root_a, root_b = find(k), find(other)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    members = defaultdict(list)
+    for k in keys:
+        members[find(k)].append(k)
+
+    mapping = {}
+    for group in members.values():
+        representative = max(group, key=lambda k: (weights.get(k, 0), -len(k), k))
+        for k in group:
+            mapping[k] = representative
+    return mapping
+
+def _similar(a: str, b: str) -> bool:
+    a, b = a.replace(" ", ""), b.replace(" ", "")
+    if a == b:
+        return True
+    if min(len(a), len(b)) < MIN_FUZZY_LENGTH:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= SIMILARITY_THRESHOLD
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
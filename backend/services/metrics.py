@@ -0,0 +1,134 @@
+import time
+from prometheus_client import Counter, Histogram, Gauge, CONTENT_TYPE_LATEST, generate_latest
+from services.profiling import record_span
+
+# Everything here is an in-memory counter/histogram update, cheap enough to leave on.
+
+HTTP_LATENCY = Histogram(
+    "api_request_duration_seconds",
+    "API request latency by route template",
+    ["method", "route", "status"]
+)
+
+SUPABASE_LATENCY = Histogram(
+    "supabase_query_duration_seconds",
+    "Supabase (PostgREST) request latency",
+    ["table", "operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+LLM_LATENCY = Histogram(
+    "llm_call_duration_seconds",
+    "Groq call latency per call site",
+    ["call_site", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Groq tokens used per call site",
+    ["call_site", "kind"]
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit/miss/stale)",
+    ["cache", "result"]
+)
+
+SYNC_ROWS = Counter(
+    "teller_sync_rows_total",
+    "Transactions written by /api/teller/sync"
+)
+
+SYNC_DURATION = Histogram(
+    "teller_sync_duration_seconds",
+    "Wall time of /api/teller/sync",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 40, 80)
+)
+
+SYNC_THROUGHPUT = Gauge(
+    "teller_sync_rows_per_second",
+    "Rows per second of the most recent sync"
+)
+
+# PostgREST method -> our operation label (POST covers insert and upsert)
+_OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+def observe_request(method: str, route: str, status: int, latency: float):
+    HTTP_LATENCY.labels(method, route, str(status)).observe(latency)
+
+def route_template(scope: dict) -> str:
+    """
+    Route label for a request: the matched route's path template
+    (/api/subscriptions/detect/jobs/{job_id}), or "unmatched".
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    # Routers included with a prefix can leave it out of route.path; it is
+    # whatever precedes the part of the request path the route matched
+    path = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is not None:
+        for i, char in enumerate(path):
+            if char == "/" and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+def observe_cache(cache: str, result: str, count: int = 1):
+    if count:
+        CACHE_REQUESTS.labels(cache, result).inc(count)
+
+def observe_llm(call_site: str, latency: float, outcome: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    LLM_LATENCY.labels(call_site, outcome).observe(latency)
+    if prompt_tokens:
+        LLM_TOKENS.labels(call_site, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(call_site, "completion").inc(completion_tokens)
+
+def observe_sync(rows: int, duration: float):
+    SYNC_ROWS.inc(rows)
+    SYNC_DURATION.observe(duration)
+    if duration > 0:
+        SYNC_THROUGHPUT.set(rows / duration)
+
+def instrument_supabase(supabase):
+    """
+    Times every PostgREST request made by a Supabase client, labelled by
+    table and operation, using httpx event hooks on its session.
+    Silently does nothing if the client doesn't expose one.
+    """
+    try:
+        session = supabase.postgrest.session
+    except Exception as e:
+        print(f"Supabase metrics disabled: {e}")
+        return supabase
+
+    def on_request(request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    def on_response(response):
+        request = response.request
+        started = request.extensions.get("metrics_started")
+        if started is None:
+            return
+        # URL path looks like /rest/v1/<table>
+        table = request.url.path.rstrip("/").rsplit("/", 1)[-1] or "unknown"
+        operation = _OPERATIONS.get(request.method, request.method.lower())
+        if operation == "insert" and "resolution=merge-duplicates" in request.headers.get("prefer", ""):
+            operation = "upsert"
+        elapsed = time.perf_counter() - started
+        SUPABASE_LATENCY.labels(table, operation).observe(elapsed)
+        record_span("supabase", f"{operation} {table}", elapsed)
+
+    session.event_hooks["request"].append(on_request)
+    session.event_hooks["response"].append(on_response)
+    return supabase
+
+def render():
+    """
+    Returns (body, content_type) in the Prometheus text format.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,174 @@
+import os
+import sys
+import hmac
+import json
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from fastapi.routing import APIRoute
+
+# Profiling is off unless a token is configured; requests opt in with
+# "X-Profile: <token>" (a header, so the token stays out of access logs).
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+
+# Frames that mean "this thread is parked", not doing work for anyone
+_IDLE_FUNCTIONS = {"wait", "select", "poll", "_worker", "accept", "get", "_wait_for_tstate_lock"}
+
+# Spans of the request being profiled (None when not profiling)
+_spans: contextvars.ContextVar = contextvars.ContextVar("profile_spans", default=None)
+# Idents of the threads currently working for the profiled request
+_threads: contextvars.ContextVar = contextvars.ContextVar("profile_threads", default=None)
+
+def should_profile(headers) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    token = headers.get("x-profile")
+    return bool(token) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+def traced(fn: Callable) -> Callable:
+    """
+    Wraps fn so that, when it runs inside a profiled request's context (the
+    endpoint itself, or pool work submitted with copy_context().run), its thread
+    is sampled for that request. Other requests' threads are never included.
+    """
+    if getattr(fn, "_profiled", False):
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        threads = _threads.get()
+        if threads is None:
+            return fn(*args, **kwargs)
+        ident = threading.get_ident()
+        threads.add(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            threads.discard(ident)
+
+    wrapper._profiled = True
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """
+    Route class that runs sync endpoints through traced(), so the threadpool
+    thread serving a profiled request shows up in its samples.
+    """
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = traced(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def record_span(kind: str, name: str, seconds: float):
+    """
+    Notes an outbound call (supabase / groq / teller) against the profiled request, if any.
+    """
+    spans = _spans.get()
+    if spans is not None:
+        spans.append({"kind": kind, "name": name, "seconds": round(seconds, 6)})
+
+class Sampler(threading.Thread):
+    """
+    Wall-clock sampling profiler: every interval, records the stack of each busy
+    thread in threads (the request's own, see traced) as a folded
+    "thread;frame;frame" line (flamegraph.pl / speedscope input).
+    """
+    def __init__(self, threads: set, interval: float = PROFILE_INTERVAL_SECONDS):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.threads = threads
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self.stopped.wait(self.interval):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            tracked = set(self.threads)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in tracked:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if not stack or stack[0].split(" ", 1)[0] in _IDLE_FUNCTIONS:
+                    continue
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+class RequestProfile:
+    """
+    Profiles one request: a stack sampler plus the outbound-call spans recorded
+    through record_span while the request runs.
+    """
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.spans: List[Dict] = []
+        self.threads: set = set()
+        self.sampler = Sampler(self.threads)
+        self.token = None
+        self.threads_token = None
+        self.started = None
+
+    def start(self):
+        self.token = _spans.set(self.spans)
+        self.threads_token = _threads.set(self.threads)
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self, status: int) -> Optional[str]:
+        """
+        Stops sampling and writes <id>.folded and <id>.json to PROFILE_DIR. Returns the id.
+        """
+        self.sampler.stop()
+        wall = time.perf_counter() - self.started
+        _spans.reset(self.token)
+        _threads.reset(self.threads_token)
+
+        profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{self.method}_{self.path.strip('/').replace('/', '_') or 'root'}"
+        by_kind = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+        for span in self.spans:
+            by_kind[span["kind"]]["count"] += 1
+            by_kind[span["kind"]]["seconds"] += span["seconds"]
+        outbound = sum(k["seconds"] for k in by_kind.values())
+
+        summary = {
+            "id": profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "wall_seconds": round(wall, 6),
+            "outbound": {kind: {"count": v["count"], "seconds": round(v["seconds"], 6)} for kind, v in by_kind.items()},
+            # Outbound calls can overlap (thread pools), so this can go negative on parallel paths
+            "unaccounted_seconds": round(wall - outbound, 6),
+            "samples": sum(self.sampler.samples.values()),
+            "spans": self.spans
+        }
+
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w") as f:
+                for stack, count in self.sampler.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+        except OSError as e:
+            print(f"Failed to write profile {profile_id}: {e}")
+            return None
+
+        print(f"Profile written: {profile_id} ({summary['wall_seconds']}s, {summary['samples']} samples)")
+        return profile_id
@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+
+class RateLimiter:
+    """
+    Token-bucket limiter for an API with both requests-per-minute and
+    tokens-per-minute quotas (Groq). acquire() blocks until both buckets can
+    cover the call; backoff() pauses every caller after a 429.
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_tokens = float(requests_per_minute)
+        self.llm_tokens = float(tokens_per_minute)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int, timeout: float = 120.0) -> bool:
+        """
+        Waits until one request and ~tokens LLM tokens are available and takes them.
+        Returns False if that would take longer than timeout.
+        """
+        # A single call larger than the whole minute budget can never fit; let it through alone
+        tokens = min(tokens, self.tpm)
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.request_tokens >= 1 and self.llm_tokens >= tokens:
+                        self.request_tokens -= 1
+                        self.llm_tokens -= tokens
+                        return True
+                    wait = max(
+                        (1 - self.request_tokens) * 60.0 / self.rpm,
+                        (tokens - self.llm_tokens) * 60.0 / self.tpm,
+                        0.05
+                    )
+
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def backoff(self, seconds: float):
+        """
+        Pauses all callers (e.g. after rate_limit_exceeded / Retry-After).
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # The server says we're over quota, so our buckets were too optimistic
+            self.request_tokens = min(self.request_tokens, 0)
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.request_tokens = min(self.rpm, self.request_tokens + elapsed * self.rpm / 60.0)
+        self.llm_tokens = min(self.tpm, self.llm_tokens + elapsed * self.tpm / 60.0)
+
+def estimate_tokens(*texts: str, completion: int = 300) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return sum(len(t) for t in texts) // 4 + completion
+
+# Shared by every Groq call in this process
+groq_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("GROQ_RPM", "30")),
+    tokens_per_minute=int(os.getenv("GROQ_TPM", "12000"))
+)
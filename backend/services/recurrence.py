@@ -0,0 +1,102 @@
+from collections import Counter
+from datetime import date
+from statistics import median, mean, pstdev
+from typing import List, Dict, Optional
+
+# cadence -> (period in days, tolerance in days)
+# No "yearly": detection looks at 180 days, which can't hold two yearly charges.
+# Other steady schedules (semiannual, every 2 months...) are left to the LLM.
+CADENCES = {
+    "weekly": (7.0, 1.5),
+    "biweekly": (14.0, 2.0),
+    "monthly": (30.44, 4.0),
+    "quarterly": (91.31, 8.0),
+}
+
+# Median gap must be within this fraction of a cadence's period to match it
+MAX_PERIOD_ERROR = 0.25
+
+# Decision thresholds on the 0-1 recurrence score
+ACCEPT_SCORE = 0.85
+REJECT_SCORE = 0.35
+# A single gap can't prove a schedule, so local acceptance needs at least this many charges
+MIN_CHARGES_TO_ACCEPT = 3
+
+# Off-schedule groups are rejected outright when charges come this often
+# (daily coffee, groceries)...
+MIN_SUBSCRIPTION_GAP_DAYS = 5
+# ...or when both gaps and amounts vary this much (coefficient of variation)
+MAX_IRREGULAR_GAP_CV = 0.5
+MAX_IRREGULAR_AMOUNT_CV = 0.25
+
+def analyze_recurrence(txs: List[Dict]) -> Dict:
+    """
+    Scores how subscription-like a merchant group looks from its dates and amounts alone.
+    Returns {"score", "cadence", "decision"} where decision is "accept", "reject"
+    or "ambiguous" (send to the LLM). Gaps that match no known cadence are
+    rejected when they are short or erratic, otherwise ambiguous.
+    """
+    dates = sorted(set(_parse_date(t["date"]) for t in txs if t.get("date")))
+    amounts = [abs(float(t["amount"])) for t in txs if t.get("amount") is not None]
+
+    if len(dates) < 2:
+        # Everything on one day (split payment, refund pair...) is not a schedule
+        return {"score": 0.0, "cadence": None, "decision": "reject"}
+
+    gaps = [(b - a).days for a, b in zip(dates, dates[1:])]
+    cadence = _match_cadence(median(gaps))
+
+    if cadence is None:
+        irregular = _cv(gaps) > MAX_IRREGULAR_GAP_CV and _cv(amounts) > MAX_IRREGULAR_AMOUNT_CV
+        frequent = median(gaps) < MIN_SUBSCRIPTION_GAP_DAYS
+        return {"score": 0.0, "cadence": None, "decision": "reject" if frequent or irregular else "ambiguous"}
+
+    period, tolerance = CADENCES[cadence]
+    gap_score = sum(1 for g in gaps if abs(g - period) <= tolerance) / len(gaps)
+    amount_score = _amount_score(amounts)
+    day_score = _day_score(dates, cadence)
+
+    score = round(0.5 * gap_score + 0.3 * amount_score + 0.2 * day_score, 3)
+
+    if score >= ACCEPT_SCORE and len(dates) >= MIN_CHARGES_TO_ACCEPT:
+        decision = "accept"
+    elif score <= REJECT_SCORE:
+        decision = "reject"
+    else:
+        decision = "ambiguous"
+
+    return {"score": score, "cadence": cadence, "decision": decision}
+
+def _match_cadence(gap: float) -> Optional[str]:
+    best, best_error = None, None
+    for name, (period, _) in CADENCES.items():
+        error = abs(gap - period) / period
+        if best_error is None or error < best_error:
+            best, best_error = name, error
+    return best if best_error <= MAX_PERIOD_ERROR else None
+
+def _cv(values: List[float]) -> float:
+    # Coefficient of variation; infinite when it can't be computed
+    if not values or mean(values) == 0:
+        return float("inf")
+    return pstdev(values) / mean(values)
+
+def _amount_score(amounts: List[float]) -> float:
+    # 1.0 for identical charges, 0 once the coefficient of variation reaches 25%
+    return max(0.0, 1.0 - _cv(amounts) / 0.25)
+
+def _day_score(dates: List[date], cadence: str) -> float:
+    # Weekly/biweekly charges land on the same weekday, the rest on the same day of month
+    if cadence in ("weekly", "biweekly"):
+        keys = [d.weekday() for d in dates]
+        return Counter(keys).most_common(1)[0][1] / len(keys)
+
+    days = [d.day for d in dates]
+    anchor = median(days)
+    # Allow drift for short months and weekend/holiday shifts
+    return sum(1 for d in days if abs(d - anchor) <= 3) / len(days)
+
+def _parse_date(value) -> date:
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
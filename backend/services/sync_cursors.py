@@ -0,0 +1,53 @@
+from datetime import datetime
+from typing import List, Dict
+from supabase import Client
+
+def load_cursors(user_id: str, supabase: Client) -> Dict[str, Dict]:
+    """
+    Loads the per-account high-water marks for a user. Returns {account_id: cursor}.
+    """
+    try:
+        response = supabase.table("teller_sync_cursors") \
+            .select("account_id, last_transaction_id, last_transaction_date") \
+            .eq("user_id", user_id) \
+            .execute()
+        return {row["account_id"]: row for row in response.data}
+    except Exception as e:
+        # Without cursors we simply fall back to a full walk
+        print(f"Failed to load sync cursors for {user_id}: {e}")
+        return {}
+
+def advance_cursors(user_id: str, transactions_by_account: Dict[str, List[Dict]], failed_ids: set, supabase: Client) -> int:
+    """
+    Moves each account's cursor to the newest transaction just fetched.
+    Accounts with any failed row keep their old cursor so the next sync retries them.
+    Returns the number of cursors written.
+    """
+    rows = []
+    now = datetime.now().isoformat()
+
+    for account_id, transactions in transactions_by_account.items():
+        if not transactions:
+            continue
+        if any(t['id'] in failed_ids for t in transactions):
+            continue
+
+        # Teller returns newest first, but don't rely on it across pages
+        newest = max(transactions, key=lambda t: t['date'])
+        rows.append({
+            "user_id": user_id,
+            "account_id": account_id,
+            "last_transaction_id": newest['id'],
+            "last_transaction_date": newest['date'],
+            "updated_at": now
+        })
+
+    if not rows:
+        return 0
+
+    try:
+        supabase.table("teller_sync_cursors").upsert(rows, on_conflict="user_id,account_id").execute()
+        return len(rows)
+    except Exception as e:
+        print(f"Failed to save sync cursors for {user_id}: {e}")
+        return 0
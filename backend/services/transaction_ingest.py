@@ -0,0 +1,64 @@
+from typing import List, Dict, Tuple
+from supabase import Client
+
+# PostgREST accepts large JSON bodies, but raw_json blobs add up quickly.
+# 500 rows keeps each request well under typical proxy body limits.
+UPSERT_CHUNK_SIZE = 500
+
+def map_teller_transaction(t: Dict, user_id: str) -> Dict:
+    """
+    Maps a Teller transaction to a row for our transactions table.
+    """
+    # Teller trans keys: id, account_id, amount, date, description, type, status, links
+    # Teller amounts are strings. Positive for credit, negative for debit.
+    # We keep the raw sign (Teller: - is money out) and just convert to float.
+    details = t.get('details') or {}
+    counterparty = details.get('counterparty') or {}
+
+    return {
+        "user_id": user_id,
+        "teller_transaction_id": t['id'],
+        "account_id": t['account_id'],
+        "name": t['description'],
+        "merchant_name": counterparty.get('name'), # basic attempt to parse
+        "amount": float(t['amount']),
+        "date": t['date'],
+        "category": details.get('category'), # Teller might not provide this in basic
+        "raw_json": t
+    }
+
+def bulk_upsert_transactions(rows: List[Dict], supabase: Client, chunk_size: int = UPSERT_CHUNK_SIZE) -> Tuple[int, List[Dict]]:
+    """
+    Upserts transaction rows in chunks keyed on teller_transaction_id.
+    If a chunk is rejected, its rows are retried one by one so a single bad
+    row only fails itself.
+    Returns (synced_count, failures) where each failure is {"id", "error"}.
+    """
+    # Postgres refuses an ON CONFLICT batch that touches the same row twice,
+    # so keep only the last occurrence of each id.
+    deduped = {}
+    for row in rows:
+        deduped[row["teller_transaction_id"]] = row
+    rows = list(deduped.values())
+
+    synced = 0
+    failures = []
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            supabase.table("transactions").upsert(chunk, on_conflict="teller_transaction_id").execute()
+            synced += len(chunk)
+            continue
+        except Exception as e:
+            print(f"Bulk upsert of {len(chunk)} transactions failed, retrying row by row: {e}")
+
+        for row in chunk:
+            try:
+                supabase.table("transactions").upsert(row, on_conflict="teller_transaction_id").execute()
+                synced += 1
+            except Exception as e:
+                print(f"Error saving transaction {row['teller_transaction_id']}: {e}")
+                failures.append({"id": row["teller_transaction_id"], "error": str(e)})
+
+    return synced, failures
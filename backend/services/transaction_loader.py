@@ -0,0 +1,72 @@
+import os
+from typing import Iterator, Optional
+from supabase import Client
+
+# Rows per request; PostgREST's max-rows (1000 by default) caps it either way
+TX_PAGE_SIZE = int(os.getenv("TX_PAGE_SIZE", "1000"))
+
+class TxRecord:
+    """
+    The transaction columns detection uses, without the per-row dict (and raw_json).
+    Supports t["amount"] / t.get("category") so it drops in where row dicts were used.
+    """
+    __slots__ = ("id", "name", "merchant_name", "amount", "date", "category")
+
+    COLUMNS = "id, name, merchant_name, amount, date, category"
+
+    def __init__(self, id: str, name: Optional[str], merchant_name: Optional[str], amount: float, date: str, category: Optional[str]):
+        self.id = id
+        self.name = name
+        self.merchant_name = merchant_name
+        self.amount = amount
+        self.date = date
+        self.category = category
+
+    @classmethod
+    def from_row(cls, row: dict) -> "TxRecord":
+        amount = row.get("amount")
+        return cls(
+            row["id"],
+            row.get("name"),
+            row.get("merchant_name"),
+            float(amount) if amount is not None else None,
+            row.get("date"),
+            row.get("category")
+        )
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return f"TxRecord({self.date} {self.name!r} {self.amount})"
+
+def stream_transactions(user_id: str, since: str, supabase: Client, page_size: int = TX_PAGE_SIZE) -> Iterator[TxRecord]:
+    """
+    Yields the user's transactions dated on or after since, oldest first, as TxRecords.
+    Walks the whole window with keyset pagination on (date, id), so large
+    histories aren't cut off at the PostgREST row cap and no page is re-scanned.
+    """
+    last = None
+    while True:
+        query = supabase.table("transactions") \
+            .select(TxRecord.COLUMNS) \
+            .eq("user_id", user_id) \
+            .gte("date", since)
+        if last is not None:
+            last_date, last_id = last
+            query = query.or_(f"date.gt.{last_date},and(date.eq.{last_date},id.gt.{last_id})")
+
+        rows = query.order("date").order("id").limit(page_size).execute().data
+        # Stop on an empty page, not a short one: if page_size is above the
+        # server's max-rows, every full page comes back short
+        if not rows:
+            return
+        for row in rows:
+            yield TxRecord.from_row(row)
+        last = (rows[-1]["date"], rows[-1]["id"])
@@ -0,0 +1,218 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from supabase import Client
+from services.transaction_ingest import map_teller_transaction, bulk_upsert_transactions
+from services.sync_cursors import load_cursors, advance_cursors
+
+# Signing secrets from the Teller dashboard; comma-separated so they can be rotated
+TELLER_WEBHOOK_SECRETS = [s.strip() for s in os.getenv("TELLER_WEBHOOK_SECRETS", "").split(",") if s.strip()]
+# Events signed longer ago than this are refused (replay protection)
+WEBHOOK_TOLERANCE_SECONDS = int(os.getenv("WEBHOOK_TOLERANCE_SECONDS", "180"))
+
+# An account is fetched once events for it stop arriving for DEBOUNCE seconds,
+# and at the latest MAX_DELAY seconds after the first event of a burst
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "10"))
+WEBHOOK_MAX_DELAY_SECONDS = float(os.getenv("WEBHOOK_MAX_DELAY_SECONDS", "60"))
+# Failed fetches are re-queued this many times; after that the next event (or /sync) catches up
+WEBHOOK_SYNC_MAX_RETRIES = int(os.getenv("WEBHOOK_SYNC_MAX_RETRIES", "3"))
+
+def sign_payload(body: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """
+    Builds a Teller-Signature header value: "t=<unix ts>,v1=<hex hmac-sha256 of '<ts>.<body>'>".
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def verify_signature(body: bytes, header: Optional[str], secrets: List[str] = None, now: Optional[float] = None) -> bool:
+    """
+    Checks a Teller-Signature header against the raw request body.
+    Any v1 signature matching any configured secret passes, within the replay window.
+    """
+    secrets = TELLER_WEBHOOK_SECRETS if secrets is None else secrets
+    if not header or not secrets:
+        return False
+
+    timestamp = None
+    signatures = []
+    for part in header.split(","):
+        key, _, value = part.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        return False
+    now = time.time() if now is None else now
+    if abs(now - int(timestamp)) > WEBHOOK_TOLERANCE_SECONDS:
+        return False
+
+    for secret in secrets:
+        expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+        if any(hmac.compare_digest(expected, signature) for signature in signatures):
+            return True
+    return False
+
+def register_accounts(user_id: str, access_token: str, accounts: List[Dict], supabase: Client):
+    """
+    Remembers which user and access token each Teller account belongs to.
+    Called on every /sync so tokens stay current after a re-enrollment.
+    """
+    now = datetime.now().isoformat()
+    rows = [
+        {
+            "account_id": account["id"],
+            "user_id": user_id,
+            "enrollment_id": account.get("enrollment_id"),
+            "access_token": access_token,
+            "status": "connected",
+            "updated_at": now
+        }
+        for account in accounts
+        if account.get("enrollment_id")
+    ]
+    if not rows:
+        return
+    try:
+        supabase.table("teller_accounts").upsert(rows, on_conflict="account_id").execute()
+    except Exception as e:
+        # Webhook sync just won't know these accounts; /sync still works
+        print(f"Failed to register Teller accounts for {user_id}: {e}")
+
+def disconnect_enrollment(enrollment_id: str, supabase: Client) -> int:
+    """
+    Marks every account of an enrollment as disconnected. Returns the number of accounts.
+    """
+    response = supabase.table("teller_accounts") \
+        .update({"status": "disconnected", "updated_at": datetime.now().isoformat()}) \
+        .eq("enrollment_id", enrollment_id) \
+        .execute()
+    return len(response.data or [])
+
+class AccountSyncQueue:
+    """
+    Debounced per-account incremental fetches, run by one background thread.
+    A burst of events for the same account collapses into a single fetch.
+    """
+    def __init__(self, supabase: Client, teller_client, debounce: float = WEBHOOK_DEBOUNCE_SECONDS, max_delay: float = WEBHOOK_MAX_DELAY_SECONDS):
+        self.supabase = supabase
+        self.teller_client = teller_client
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        # account_id -> (first event at, last event at), monotonic seconds
+        self.pending: Dict[str, tuple] = {}
+        # account_id -> failed fetches in a row
+        self.retries: Dict[str, int] = defaultdict(int)
+        self.worker = None
+
+    def schedule(self, account_ids: List[str]):
+        now = time.monotonic()
+        with self.condition:
+            for account_id in account_ids:
+                first, _ = self.pending.get(account_id, (now, now))
+                self.pending[account_id] = (first, now)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True, name="webhook-sync")
+                self.worker.start()
+            self.condition.notify()
+
+    def _due_at(self, entry: tuple) -> float:
+        first, last = entry
+        return min(last + self.debounce, first + self.max_delay)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.monotonic()
+                    due = [a for a, entry in self.pending.items() if self._due_at(entry) <= now]
+                    if due:
+                        for account_id in due:
+                            del self.pending[account_id]
+                        break
+                    timeout = min((self._due_at(e) for e in self.pending.values()), default=None)
+                    self.condition.wait(None if timeout is None else timeout - now)
+
+            # Events arriving while this runs are queued for another pass
+            try:
+                self.sync_accounts(due)
+            except Exception as e:
+                print(f"Webhook sync failed for {len(due)} accounts: {e}")
+
+    def sync_accounts(self, account_ids: List[str]) -> int:
+        """
+        Fetches new activity for the given accounts (from their sync cursors) and saves it.
+        Each (user, token) batch fails on its own: a revoked token (401) disconnects its
+        enrollment, other errors re-queue the batch. Returns the number of transactions written.
+        """
+        response = self.supabase.table("teller_accounts") \
+            .select("account_id, user_id, enrollment_id, access_token") \
+            .in_("account_id", account_ids) \
+            .eq("status", "connected") \
+            .execute()
+
+        # One Teller call batch per (user, token), accounts of it fetched concurrently
+        by_token = defaultdict(list)
+        enrollments = defaultdict(set)
+        for row in response.data:
+            by_token[(row["user_id"], row["access_token"])].append(row["account_id"])
+            enrollments[(row["user_id"], row["access_token"])].add(row.get("enrollment_id"))
+
+        total_synced = 0
+        for (user_id, access_token), ids in by_token.items():
+            try:
+                total_synced += self._sync_token(user_id, access_token, ids)
+            except Exception as e:
+                if getattr(getattr(e, "response", None), "status_code", None) == 401:
+                    print(f"Webhook sync: token of {user_id} was revoked, disconnecting its accounts")
+                    for enrollment_id in enrollments[(user_id, access_token)] - {None}:
+                        disconnect_enrollment(enrollment_id, self.supabase)
+                    self._forget_retries(ids)
+                else:
+                    print(f"Webhook sync failed for {len(ids)} accounts of {user_id}: {e}")
+                    self._retry(ids)
+            else:
+                self._forget_retries(ids)
+
+        print(f"Webhook sync: {len(account_ids)} accounts, {total_synced} transactions saved.")
+        return total_synced
+
+    def _sync_token(self, user_id: str, access_token: str, account_ids: List[str]) -> int:
+        cursors = load_cursors(user_id, self.supabase)
+        transactions_by_account = self.teller_client.get_transactions_for_accounts(access_token, account_ids, cursors=cursors)
+
+        rows = [
+            map_teller_transaction(t, user_id)
+            for transactions in transactions_by_account.values()
+            for t in transactions
+        ]
+        synced, failures = bulk_upsert_transactions(rows, self.supabase)
+        advance_cursors(user_id, transactions_by_account, {f["id"] for f in failures}, self.supabase)
+        return synced
+
+    def _retry(self, account_ids: List[str]):
+        again = []
+        with self.condition:
+            for account_id in account_ids:
+                self.retries[account_id] += 1
+                if self.retries[account_id] <= WEBHOOK_SYNC_MAX_RETRIES:
+                    again.append(account_id)
+                else:
+                    del self.retries[account_id]
+        if len(again) < len(account_ids):
+            print(f"Webhook sync: giving up on {len(account_ids) - len(again)} accounts after {WEBHOOK_SYNC_MAX_RETRIES} retries")
+        if again:
+            self.schedule(again)
+
+    def _forget_retries(self, account_ids: List[str]):
+        with self.condition:
+            for account_id in account_ids:
+                self.retries.pop(account_id, None)
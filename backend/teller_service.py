@@ -1,13 +1,25 @@
 import os
 import requests
 import json
+import contextvars
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from services.profiling import record_span, traced
 
 load_dotenv()
 
 TELLER_API_URL = "https://api.teller.io"
 TELLER_CERT_PATH = os.getenv("TELLER_CERT_PATH", "certs/certificate.pem")
 TELLER_KEY_PATH = os.getenv("TELLER_KEY_PATH", "certs/private_key.pem")
+# Max accounts fetched at once during a sync (also sizes the connection pool)
+TELLER_MAX_CONCURRENCY = int(os.getenv("TELLER_MAX_CONCURRENCY", "4"))
+TELLER_PAGE_SIZE = 100
+# Incremental syncs re-scan this many days before the cursor date: pending rows
+# post later under a new id, and ACH entries can be backdated
+TELLER_LOOKBACK_DAYS = int(os.getenv("TELLER_LOOKBACK_DAYS", "7"))
 
 class TellerClient:
     def __init__(self):
@@ -18,6 +30,16 @@ class TellerClient:
         else:
             self.cert = (TELLER_CERT_PATH, TELLER_KEY_PATH)
 
+        # One keep-alive session so the mTLS handshake is paid once per pooled
+        # connection instead of once per request.
+        self.session = requests.Session()
+        self.session.cert = self.cert
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TELLER_MAX_CONCURRENCY)
+        self.session.mount(TELLER_API_URL, adapter)
+        self.session.hooks["response"].append(
+            lambda response, *args, **kwargs: record_span("teller", response.request.path_url.split("?")[0], response.elapsed.total_seconds())
+        )
+
     def _get_headers(self, access_token: str = None):
         headers = {"Content-Type": "application/json"}
         if access_token:
@@ -34,26 +56,79 @@ class TellerClient:
             
         url = f"{TELLER_API_URL}/accounts"
         # Access token is used as the username for Basic Auth
-        response = requests.get(
+        response = self.session.get(
             url, 
-            cert=self.cert, 
             auth=(access_token, "")
         )
         response.raise_for_status()
         return response.json()
 
-    def get_transactions(self, access_token: str, account_id: str, count: int = 100):
+    def get_transactions(self, access_token: str, account_id: str, count: int = TELLER_PAGE_SIZE, from_id: Optional[str] = None):
         if not self.cert:
             raise ValueError("Teller certificates are missing.")
 
         url = f"{TELLER_API_URL}/accounts/{account_id}/transactions"
-        response = requests.get(
+        params = {"count": count}
+        if from_id:
+            # Teller pages backwards in time starting after this transaction
+            params["from_id"] = from_id
+
+        response = self.session.get(
             url, 
-            cert=self.cert, 
             auth=(access_token, ""),
-            params={"count": count}
+            params=params
         )
         response.raise_for_status()
         return response.json()
 
+    def iter_transactions(self, access_token: str, account_id: str, cursor: Optional[Dict] = None, page_size: int = TELLER_PAGE_SIZE) -> Iterator[Dict]:
+        """
+        Pages through an account's transactions, newest first.
+        With a cursor ({"last_transaction_date", ...}) it stops once it is
+        TELLER_LOOKBACK_DAYS older than the high-water date; rows seen before are
+        re-yielded and deduplicated by the idempotent upsert. Without one it walks
+        the full history.
+        """
+        stop_date = None
+        if cursor and cursor.get("last_transaction_date"):
+            mark = date.fromisoformat(str(cursor["last_transaction_date"])[:10])
+            stop_date = (mark - timedelta(days=TELLER_LOOKBACK_DAYS)).isoformat()
+        from_id = None
+
+        while True:
+            page = self.get_transactions(access_token, account_id, count=page_size, from_id=from_id)
+
+            for t in page:
+                if t['id'] == from_id:
+                    continue
+                # Rows inside the lookback window may still be new
+                if stop_date and t['date'] < stop_date:
+                    return
+                yield t
+
+            if len(page) < page_size:
+                return
+            from_id = page[-1]['id']
+
+    def get_transactions_for_accounts(self, access_token: str, account_ids: List[str], cursors: Optional[Dict[str, Dict]] = None, max_workers: int = TELLER_MAX_CONCURRENCY) -> Dict[str, List[Dict]]:
+        """
+        Fetches transactions for several accounts concurrently over the pooled session.
+        Accounts with an entry in cursors only fetch activity since it (minus the lookback).
+        At most max_workers requests are in flight. Returns {account_id: transactions}.
+        """
+        if not account_ids:
+            return {}
+        cursors = cursors or {}
+
+        def fetch(account_id):
+            return list(self.iter_transactions(access_token, account_id, cursors.get(account_id)))
+
+        workers = max(1, min(max_workers, len(account_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                account_id: executor.submit(contextvars.copy_context().run, traced(fetch), account_id)
+                for account_id in account_ids
+            }
+            return {account_id: future.result() for account_id, future in futures.items()}
+
 client = TellerClient()
@@ -0,0 +1,43 @@
+import os
+import sys
+
+# Add parent dir to path if run from backend dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from services.merchant_clustering import canonical_merchant, cluster_keys
+
+# Run with: python -m pytest test_merchant_clustering.py (or python test_merchant_clustering.py)
+
+def test_near_duplicates_merge():
+    pairs = [
+        ("netflix", "netflx"),
+        ("disney plus", "disneyplus"),
+        ("spotify premium", "spotify premum"),
+    ]
+    for a, b in pairs:
+        mapping = cluster_keys([a, b], {a: 5, b: 1})
+        assert mapping[a] == mapping[b] == a, f"{a!r} / {b!r} were not merged: {mapping}"
+
+def test_distinct_merchants_stay_apart():
+    keys = ["netflix", "hulu", "hula", "lyft", "lift", "spotify", "uber", "uber eats", "adobe"]
+    mapping = cluster_keys(keys)
+    assert all(mapping[k] == k for k in keys), mapping
+
+def test_canonical_variants_cluster():
+    raw = ["NETFLIX.COM 866-579", "Netflix", "NETFLX.COM", "Spotify USA Inc.", "SPOTIFY"]
+    keys = [canonical_merchant(r) for r in raw]
+    mapping = cluster_keys(keys)
+    assert len({mapping[k] for k in keys}) == 2, mapping
+
+def test_compound_names_keep_single_letters():
+    assert canonical_merchant("T-Mobile USA") == "tmobile"
+    assert canonical_merchant("AT&T Bill Payment") == "att"
+    assert canonical_merchant("Barnes & Noble") == "barnes noble"
+    mapping = cluster_keys([canonical_merchant("T-Mobile"), canonical_merchant("Mobile Mini")])
+    assert len(set(mapping.values())) == 2, mapping
+
+if __name__ == "__main__":
+    test_near_duplicates_merge()
+    test_distinct_merchants_stay_apart()
+    test_canonical_variants_cluster()
+    test_compound_names_keep_single_letters()
+    print("Merchant clustering checks passed.")
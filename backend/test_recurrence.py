@@ -0,0 +1,46 @@
+import os
+import sys
+import random
+from datetime import date, timedelta
+
+# Add parent dir to path if run from backend dir
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from services.recurrence import analyze_recurrence
+
+# Run with: python -m pytest test_recurrence.py (or python test_recurrence.py)
+
+def _txs(days, amounts):
+    start = date(2026, 1, 5)
+    return [{"date": (start + timedelta(days=d)).isoformat(), "amount": a} for d, a in zip(days, amounts)]
+
+def test_monthly_charge_accepted():
+    result = analyze_recurrence(_txs([0, 31, 59, 90, 120, 151], [15.49] * 6))
+    assert result["decision"] == "accept" and result["cadence"] == "monthly", result
+
+def test_biweekly_charge_accepted():
+    result = analyze_recurrence(_txs([0, 14, 28, 42, 56], [9.99] * 5))
+    assert result["decision"] == "accept" and result["cadence"] == "biweekly", result
+
+def test_daily_coffee_rejected():
+    result = analyze_recurrence(_txs(range(60), [4.50] * 60))
+    assert result["decision"] == "reject", result
+
+def test_irregular_groceries_rejected():
+    rng = random.Random(7)
+    days = sorted(rng.sample(range(180), 25))
+    amounts = [round(rng.uniform(12, 91), 2) for _ in days]
+    result = analyze_recurrence(_txs(days, amounts))
+    assert result["decision"] == "reject", result
+
+def test_steady_off_schedule_left_to_llm():
+    # Every ~2 months at the same price: no local cadence, but not erratic either
+    result = analyze_recurrence(_txs([0, 61, 122], [49.0] * 3))
+    assert result["decision"] == "ambiguous", result
+
+if __name__ == "__main__":
+    test_monthly_charge_accepted()
+    test_biweekly_charge_accepted()
+    test_daily_coffee_rejected()
+    test_irregular_groceries_rejected()
+    test_steady_off_schedule_left_to_llm()
+    print("Recurrence checks passed.")
@@ -1,8 +1,11 @@
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { Sparkles, TrendingDown, Loader2 } from 'lucide-react';
 
 const API_URL = import.meta.env.VITE_API_URL;
+// While a background re-analysis runs, re-read every 10s, at most 6 times
+const REFRESH_POLL_MS = 10000;
+const MAX_REFRESH_POLLS = 6;
 
 interface BargainOpportunity {
     subscription_id: string;
@@ -17,10 +20,22 @@ export default function BargainList() {
     const [bargains, setBargains] = useState<BargainOpportunity[]>([]);
     const [loading, setLoading] = useState(false);
     const [searched, setSearched] = useState(false);
+    const pollTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+    const polls = useRef(0);
 
-    const fetchBargains = async (forceRefresh = false) => {
+    const stopPolling = () => {
+        if (pollTimer.current) {
+            clearTimeout(pollTimer.current);
+            pollTimer.current = null;
+        }
+    };
+
+    const fetchBargains = async (forceRefresh = false, isPoll = false) => {
         if (!session?.access_token) return;
 
+        stopPolling();
+        if (!isPoll) polls.current = 0;
+
         setLoading(true);
         try {
             // Add ?refresh=true query param if forcing refresh
@@ -40,6 +55,11 @@ export default function BargainList() {
                 if (result.source === 'cache_fresh_hit') {
                     console.log("Data was fresh, API call saved.");
                 }
+                if (result.refreshing && polls.current < MAX_REFRESH_POLLS) {
+                    // Stale data shown now; pick up the background re-analysis shortly
+                    polls.current += 1;
+                    pollTimer.current = setTimeout(() => fetchBargains(false, true), REFRESH_POLL_MS);
+                }
             }
         } catch (error) {
             console.error("Error fetching bargains:", error);
@@ -53,6 +73,7 @@ export default function BargainList() {
         if (session) {
             fetchBargains(false); // Load cache only
         }
+        return stopPolling;
     }, [session]);
 
     if (!session) return null;
@@ -19,6 +19,7 @@ export default function SubscriptionList() {
     const [subscriptions, setSubscriptions] = useState<Subscription[]>([]);
     const [loading, setLoading] = useState(false);
     const [detecting, setDetecting] = useState(false);
+    const [detectProgress, setDetectProgress] = useState<{ done: number; total: number } | null>(null);
 
     const fetchSubscriptions = async () => {
         if (!session?.access_token) return;
@@ -41,20 +42,52 @@ export default function SubscriptionList() {
     const handleDetect = async () => {
         if (!session?.access_token) return;
         setDetecting(true);
+        setDetectProgress(null);
         try {
-            const response = await fetch(`${API_URL}/api/subscriptions/detect`, {
+            // NDJSON stream: candidates count, one verdict per merchant, then the summary
+            const response = await fetch(`${API_URL}/api/subscriptions/detect/stream`, {
                 method: 'POST',
                 headers: {
                     'Authorization': `Bearer ${session.access_token}`,
                 },
             });
-            const result = await response.json();
-            console.log('Detection result:', result);
+            if (!response.body) throw new Error('Streaming not supported');
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let total = 0;
+            let done = 0;
+
+            while (true) {
+                const chunk = await reader.read();
+                if (chunk.done) break;
+                buffer += decoder.decode(chunk.value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop() || '';
+
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.event === 'candidates') {
+                        total = event.count;
+                        setDetectProgress({ done, total });
+                    } else if (event.event === 'verdict') {
+                        done += 1;
+                        setDetectProgress({ done, total });
+                    } else if (event.event === 'summary') {
+                        console.log('Detection result:', event.data);
+                    } else if (event.event === 'error') {
+                        console.error('Error detecting subscriptions:', event.detail);
+                    }
+                }
+            }
             await fetchSubscriptions(); // Refresh list
         } catch (error) {
             console.error('Error detecting subscriptions:', error);
         } finally {
             setDetecting(false);
+            setDetectProgress(null);
         }
     };
 
@@ -79,7 +112,9 @@ export default function SubscriptionList() {
                     ) : (
                         <Zap size={12} />
                     )}
-                    {detecting ? 'Analyzing...' : 'Refresh Detection'}
+                    {detecting
+                        ? (detectProgress && detectProgress.total > 0 ? `Analyzing ${detectProgress.done}/${detectProgress.total}...` : 'Analyzing...')
+                        : 'Refresh Detection'}
                 </button>
             </div>
 